@@ -0,0 +1,36 @@
+import random
+import sys
+from time import perf_counter
+
+from vector import Vector
+
+DIMENSION = 1000
+SIZE = 2000
+ROUNDS = 5
+
+
+def bench(label, keys, probes):
+    table = set(keys)
+    t0 = perf_counter()
+    hits = 0
+    for _ in range(ROUNDS):
+        for v in probes:
+            hits += v in table
+    elapsed = perf_counter() - t0
+    lookups = ROUNDS * len(probes)
+    print(f'{label:>20}: {lookups / elapsed:12,.0f} lookups/s ({hits} hits)')
+
+
+def main():
+    dimension = int(sys.argv[1]) if len(sys.argv) > 1 else DIMENSION
+    print(f'Set membership of {SIZE} vectors with {dimension} components:')
+    rnd = random.Random(42)
+    rows = [[rnd.random() for _ in range(dimension)] for _ in range(SIZE * 2)]
+    keys = [Vector(row) for row in rows[:SIZE]]
+    bench('same objects', keys, keys)
+    bench('equal copies', keys, [Vector(row) for row in rows[:SIZE]])
+    bench('misses', keys, [Vector(row) for row in rows[SIZE:]])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+import random
+import sys
+from time import perf_counter
+
+import vector
+from vector import Vector, VectorMatrix
+
+DIMENSION = 64
+SIZE = 20_000
+ROUNDS = 5
+
+
+def bench(label, func, base=None):
+    func()  # warm up caches such as VectorMatrix.norms
+    t0 = perf_counter()
+    for _ in range(ROUNDS):
+        func()
+    elapsed = (perf_counter() - t0) / ROUNDS
+    speedup = f' ({base / elapsed:.1f}x)' if base else ''
+    print(f'{label:>20}: {elapsed:9.4f}s per query{speedup}')
+    return elapsed
+
+
+def main():
+    dimension = int(sys.argv[1]) if len(sys.argv) > 1 else DIMENSION
+    print(f'Queries against {SIZE} vectors with {dimension} components:')
+    rnd = random.Random(42)
+    rows = [[rnd.random() for _ in range(dimension)] for _ in range(SIZE)]
+    query = Vector(rnd.random() for _ in range(dimension))
+    vectors = [Vector(row) for row in rows]
+
+    base = bench('Vector @ per object', lambda: [v @ query for v in vectors])
+    numpy = vector.np
+    for label, module in [('array', None), ('numpy', numpy)]:
+        if label == 'numpy' and module is None:
+            print(f'{"numpy":>20}: not installed')
+            continue
+        vector.np = module
+        matrix = VectorMatrix(rows)
+        for op in ['dot', 'cosine', 'nearest']:
+            method = getattr(matrix, op)
+            bench(f'{label} {op}', lambda: method(query), base)
+    vector.np = numpy
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,21 @@
+import math
+import random
+from array import array
+
 import pytest
-from vector import Vector
+
+import vector
+from vector import Vector, VectorMatrix, VectorStore, write_vectors
+
+
+@pytest.fixture(params=['numpy', 'array'])
+def backend(request, monkeypatch):
+    """Run a test with NumPy, skipping if it is missing, and without it."""
+    if request.param == 'numpy':
+        pytest.importorskip('numpy')
+    else:
+        monkeypatch.setattr(vector, 'np', None)
+    return request.param
 
 
 def test_vector_can_built_from_an_iterable_of_numbers():
@@ -7,8 +23,8 @@ def test_vector_can_built_from_an_iterable_of_numbers():
 
     v = Vector([1, 2, 3, 4] * 10)
 
-    assert repr(v) == 'Vector([1, 2, 3, 4, 1, 2, ...])'
-    assert bytes(Vector([1, 2, 3, 4])) == b'd\x01\x02\x03\x04'
+    assert repr(v) == 'Vector([1.0, 2.0, 3.0, 4.0, 1.0, ...])'
+    assert bytes(Vector([1, 2, 3, 4]))[24:] == bytes(array('d', [1, 2, 3, 4]))
     first, second = Vector([1, 2])
     assert first == 1 and second == 2
     assert bool(v)
@@ -16,6 +32,15 @@ def test_vector_can_built_from_an_iterable_of_numbers():
     assert v != [1, 2, 3, 4] * 10
 
 
+def test_vector_from_bytes_like_iterables():
+    """Bytes are iterables of ints, not raw doubles."""
+
+    assert Vector(b'\x01\x02') == Vector([1, 2])
+    assert Vector(bytearray(b'\x01' * 8)) == Vector([1] * 8)
+    assert Vector(memoryview(b'\x03\x04')) == Vector([3, 4])
+    assert VectorMatrix([b'\x01\x02', b'\x03\x04']).dot(b'\x01\x01') == array('d', [3, 7])
+
+
 def test_vector_can_use_slicing():
     """Test of slicing"""
 
@@ -23,7 +48,7 @@ def test_vector_can_use_slicing():
 
     assert v[1] == 2
     # with pytest.raises(TypeError):
-    assert type(v[1]) == int
+    assert type(v[1]) == float
     assert v[1:4] != (2, 3, 4)
     assert type(v[1:3]) == Vector
 
@@ -66,6 +91,10 @@ def test_vector_has_hashing():
     v3 = Vector([3, 4, 5])
     v6 = Vector(range(6))
     assert (hash(v1), hash(v3), hash(v6)) == (7, 2, 1)
+    assert hash(v1) == hash(Vector([3.0, 4.0]))
+    assert v1 != v2 and v1 != v3
+    assert {v1, v3, Vector([3, 4])} == {v1, v3}
+    assert not hasattr(v1, '__dict__')
 
 
 def test_vector_can_support_format_str():
@@ -74,6 +103,30 @@ def test_vector_can_support_format_str():
     assert format(Vector([-1, -1, -1, -1]), 'h') == '<2.0, 2.0943951023931957, 2.186276035465284, 5.283185307179586>'
     assert format(Vector([2, 2, 2, 2]), '.3eh') == '<4.000e+00, 1.047e+00, 9.553e-01, 7.854e-01>'
     assert format(Vector([0, 1, 0, 0]), '0.5fh') == '<1.00000, 1.57080, 0.00000, 0.00000>'
+    assert format(Vector([]), 'h') == '<0.0>'
+
+
+def test_vector_to_spherical_matches_angle():
+    v = Vector([3, -1, 4, 1, -5, 9, 2, -6])
+    coords = v.to_spherical()
+
+    assert len(coords) == len(v)
+    assert coords[0] == abs(v)
+    assert list(coords[1:]) == pytest.approx([v.angle(n) for n in range(1, len(v))])
+    assert list(v.angles()) == list(coords[1:])
+
+
+@pytest.mark.parametrize('components', [
+    [1e200] * 3,
+    [1e-200, 1e-200, 3e-200],
+    [1e300, -1e-300, 2e300, 5, -1e300],
+])
+def test_vector_to_spherical_extreme_magnitudes(components):
+    v = Vector(components)
+    expected = [v.angle(n) for n in range(1, len(v))]
+
+    assert all(math.isfinite(a) and a > 0 for a in expected)
+    assert list(v.angles()) == pytest.approx(expected)
 
 
 def test_vector_can_concat():
@@ -122,7 +175,125 @@ def test_vector_support_richcompare():
 
     v1 = Vector([1, 2, 3])
     v1 *= 11
-    assert v1 == Vector([55, 77, 88])
+    assert v1 == Vector([11, 22, 33])
+
+
+def test_vector_can_be_iterated_many_times():
+    v = Vector(x for x in range(5))
+
+    assert len(v) == 5
+    assert list(v) == [0.0, 1.0, 2.0, 3.0, 4.0]
+    assert list(v) == [0.0, 1.0, 2.0, 3.0, 4.0]
+    assert -v == Vector([0, -1, -2, -3, -4])
+    assert v @ v == 30.0
+
+
+def test_vector_large_arithmetic(backend):
+    n = 5000
+    v1 = Vector(range(n))
+    v2 = Vector([1] * (n - 1))
+
+    assert (v1._ndarray() is not None) == (backend == 'numpy')
+
+    assert v1 + v2 == Vector([i + 1 for i in range(n - 1)] + [n - 1])
+    assert (v1 * 2)[-1] == 2.0 * (n - 1)
+    assert (-v1)[10] == -10.0
+    assert v1 @ Vector([1] * n) == sum(range(n))
+    assert abs(Vector([3, 4] + [0] * n)) == 5.0
+
+
+def test_vector_bytes_roundtrip():
+    v = Vector([1.5, -2, 3])
+    octets = bytes(v)
+
+    assert octets[:5] == b'VECSd'
+    assert Vector.frombytes(octets) == v
+    assert Vector.frombytes(bytearray(octets)) == v
+    assert Vector.frombytes(b'd' + bytes(array('d', [1, 2]))) == Vector([1, 2])
+    with pytest.raises(ValueError):
+        Vector.frombytes(octets[:-1])
+
+
+def test_vector_store_maps_file(tmp_path):
+    path = tmp_path / 'vectors.bin'
+    vectors = [Vector([i, i + 1, i + 2]) for i in range(100)]
+
+    assert write_vectors(path, vectors) == 100
+    with VectorStore(path) as store:
+        assert len(store) == 100
+        assert store.dimension == 3
+        v = store[42]
+        assert v == Vector([42, 43, 44])
+        assert repr(v) == 'Vector([42.0, 43.0, 44.0])'
+        assert store[-1] == vectors[-1]
+        assert v + Vector([1, 1, 1]) == Vector([43, 44, 45])
+        assert list(store) == vectors
+        with pytest.raises(IndexError):
+            store[100]
+        del v
+
+
+def test_write_vectors_rejects_mixed_dimensions(tmp_path):
+    with pytest.raises(ValueError):
+        write_vectors(tmp_path / 'bad.bin', [Vector([1, 2]), Vector([1, 2, 3])])
+
+
+def test_vector_matrix_batch_operations():
+    vectors = [Vector([1, 0]), Vector([0, 2]), Vector([3, 4]), Vector([0, 0])]
+    m = VectorMatrix(vectors)
+    query = Vector([1, 1])
+
+    assert len(m) == 4 and m.dimension == 2
+    assert m[2] == Vector([3, 4])
+    assert list(m.dot(query)) == [v @ query for v in vectors]
+    assert list(m.norms()) == [1.0, 2.0, 5.0, 0.0]
+    assert m.cosine(query)[0] == pytest.approx(math.sqrt(2) / 2)
+    assert m.cosine(query)[3] == 0.0
+    assert m.angles(Vector([1, 0]))[1] == pytest.approx(math.pi / 2)
+    assert [i for i, _ in m.nearest(query, k=2)] == [2, 0]
+    with pytest.raises(ValueError):
+        m.dot(Vector([1, 2, 3]))
+
+
+def test_vector_matrix_numpy_matches_fallback(monkeypatch):
+    pytest.importorskip('numpy')
+    rnd = random.Random(3)
+    rows = [[rnd.uniform(-1, 1) for _ in range(8)] for _ in range(500)]
+    rows[7] = [0.0] * 8
+    query = [rnd.uniform(-1, 1) for _ in range(8)]
+
+    fast = VectorMatrix(rows)
+    assert fast._ndarray() is not None
+    results = [fast.dot(query), fast.norms(), fast.cosine(query),
+               fast.nearest(query, k=5)]
+    monkeypatch.setattr(vector, 'np', None)
+    slow = VectorMatrix(rows)
+    expected = [slow.dot(query), slow.norms(), slow.cosine(query),
+                slow.nearest(query, k=5)]
+
+    for got, want in zip(results[:3], expected[:3]):
+        assert list(got) == pytest.approx(list(want))
+    assert [i for i, _ in results[3]] == [i for i, _ in expected[3]]
+    assert results[2][7] == expected[2][7] == 0.0
+
+
+def test_vector_matrix_without_dimensions():
+    m = VectorMatrix([])
+
+    assert len(m) == 0 and m.dimension == 0
+    assert list(m.dot([])) == []
+    assert list(m.norms()) == []
+    assert list(m.cosine([])) == []
+    assert m.nearest([]) == []
+
+
+def test_vector_store_as_matrix(tmp_path):
+    path = tmp_path / 'vectors.bin'
+    write_vectors(path, [Vector([i, 1]) for i in range(10)])
+    with VectorStore(path) as store:
+        m = store.matrix()
+        assert list(m.dot([1, 0])) == [float(i) for i in range(10)]
+        del m
 
 
 if __name__ == '__main__':
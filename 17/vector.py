@@ -1,57 +1,123 @@
 from collections import abc
 import functools
+import heapq
 import itertools
 import math
+import mmap
 import operator
 import reprlib
+import struct
 from array import array
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Below this many components the cost of wrapping the buffer in an ndarray
+# is higher than what NumPy saves, so the plain array path is used.
+NUMPY_THRESHOLD = 1024
+
+# Binary layout shared by Vector.__bytes__ and VectorStore files:
+# magic, typecode, 3 pad bytes, dimension, count, then count * dimension
+# items. The header is 24 bytes, so the items stay 8-byte aligned.
+MAGIC = b'VECS'
+HEADER = struct.Struct('<4scxxxQQ')
+
+
+def _to_array(typecode, components):
+    # array(typecode, b'...') would copy raw machine bytes; extend()
+    # iterates bytes and bytearray as ints, like any other iterable
+    items = array(typecode)
+    items.extend(components)
+    return items
+
 
 class Vector:
     typecode = 'd'
     __match_args__ = ('x', 'y', 'z', 't')
+    __slots__ = ('_components', '_hash')
 
     def __init__(self, components):
-        self._components = components
+        self._components = _to_array(self.typecode, components)
+        self._hash = None
+
+    @classmethod
+    def _frombuffer(cls, memv):
+        vector = cls.__new__(cls)
+        vector._components = memv
+        vector._hash = None
+        return vector
+
+    @classmethod
+    def _fromndarray(cls, values):
+        return cls._frombuffer(array(cls.typecode, values.tobytes()))
+
+    def _ndarray(self):
+        if np is None or len(self._components) < NUMPY_THRESHOLD:
+            return None
+        return np.frombuffer(self._components, dtype=np.float64)
 
     def __iter__(self):
         return iter(self._components)
 
     def __repr__(self):
-        components = reprlib.repr(self._components)
-        components = components[components.find('['):]
+        head = self._components[:reprlib.aRepr.maxarray + 1]
+        components = reprlib.repr(array(self.typecode, head))
+        components = components[components.find('['):-1]
         return f'Vector({components})'
 
     def __str__(self):
         return str(tuple(self))
 
     def __bytes__(self):
-        return (bytes([ord(self.typecode)]) +
-                bytes(self._components))
+        header = HEADER.pack(MAGIC, self.typecode.encode(), len(self), 1)
+        return header + bytes(self._components)
 
     def __eq__(self, other):
         if isinstance(other, Vector):
-            return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+            if self is other:
+                return True
+            if len(self._components) != len(other._components):
+                return False
+            if (self._hash is not None and other._hash is not None
+                    and self._hash != other._hash):
+                return False
+            return self._components == other._components
         else:
             return NotImplemented
 
     def __hash__(self):
-        hashes = (hash(x) for x in self._components)
-        return functools.reduce(operator.xor, hashes, 0)
+        if self._hash is None:
+            hashes = map(hash, self._components)
+            self._hash = functools.reduce(operator.xor, hashes, 0)
+        return self._hash
 
     def __abs__(self):
-        return math.hypot(*self)
+        if (values := self._ndarray()) is not None:
+            return float(np.linalg.norm(values))
+        return math.hypot(*self._components)
 
     def __neg__(self):
-        return Vector(-x for x in self)
+        if (values := self._ndarray()) is not None:
+            return self._fromndarray(-values)
+        return Vector(map(operator.neg, self._components))
 
     def __pos__(self):
         return -Vector(self)
 
     def __add__(self, other):
+        if isinstance(other, Vector):
+            a, b = self._ndarray(), other._ndarray()
+            if a is not None and b is not None:
+                if len(a) < len(b):
+                    a, b = b, a
+                result = a.copy()
+                result[:len(b)] += b
+                return self._fromndarray(result)
         try:
-            pairs = itertools.zip_longest(self, other, fillvalue=0.0)
-            return Vector(a + b for a, b in pairs)
+            pairs = itertools.zip_longest(self._components, other, fillvalue=0.0)
+            return Vector(itertools.starmap(operator.add, pairs))
         except TypeError:
             return NotImplemented
 
@@ -63,7 +129,9 @@ class Vector:
             factor = float(scalar)
         except TypeError:
             return NotImplemented
-        return Vector(n * factor for n in self)
+        if (values := self._ndarray()) is not None:
+            return self._fromndarray(values * factor)
+        return Vector(map(factor.__mul__, self._components))
 
     def __rmul__(self, scalar):
         return self * scalar
@@ -71,7 +139,11 @@ class Vector:
     def __matmul__(self, other):
         if isinstance(other, abc.Sized) and isinstance(other, abc.Iterable):
             if len(self) == len(other):
-                return sum(a * b for a, b in zip(self, other))
+                if isinstance(other, Vector):
+                    a, b = self._ndarray(), other._ndarray()
+                    if a is not None and b is not None:
+                        return float(np.dot(a, b))
+                return sum(map(operator.mul, self._components, other))
             else:
                 raise ValueError('@ requires vectors of equal length.')
         else:
@@ -84,7 +156,7 @@ class Vector:
         return bool(abs(self))
 
     def __len__(self):
-        return len(list(self._components))
+        return len(self._components)
 
     def __getitem__(self, key):
         if isinstance(key, slice):
@@ -129,12 +201,42 @@ class Vector:
             return a
 
     def angles(self):
-        return (self.angle(n) for n in range(1, len(self)))
+        return iter(self.to_spherical()[1:])
+
+    def to_spherical(self):
+        """Return ``[abs(self), angle(1), ..., angle(n - 1)]`` as an array.
+
+        The angles are computed in one reverse pass over a running sum of
+        squares instead of calling ``angle(n)`` on every tail. The sum is
+        kept scaled by ``2 ** (-2 * exp)``, where ``exp`` follows the largest
+        component so far, so huge or tiny components neither overflow nor
+        underflow; scaling by powers of two is exact, so ordinary vectors
+        get the same result as an unscaled sum.
+        """
+        components = self._components
+        size = len(components)
+        coords = array(self.typecode, [abs(self)]) * max(size, 1)
+        tail = 0.0
+        exp = 0
+        for n in range(size - 1, 0, -1):
+            x = components[n]
+            if x:
+                _, e = math.frexp(x)
+                if e > exp or not tail:
+                    tail = math.ldexp(tail, 2 * (exp - e))
+                    exp = e
+                x = math.ldexp(x, -exp)
+                tail += x * x
+            r = math.ldexp(math.sqrt(tail), exp)
+            coords[n] = math.atan2(r, components[n - 1])
+        if size > 1 and components[-1] < 0:
+            coords[-1] = self.angle(size - 1)
+        return coords
 
     def __format__(self, fmt_spec=''):
         if fmt_spec.endswith('h'):
             fmt_spec = fmt_spec[:-1]
-            coords = itertools.chain([abs(self)], self.angles())
+            coords = self.to_spherical()
             outer_fmt = '<{}>'
         else:
             coords = self
@@ -145,9 +247,224 @@ class Vector:
 
     @classmethod
     def frombytes(cls, octets):
-        typecode = chr(octets[0])
-        memv = memoryview(octets[1:]).cast(typecode)
-        return cls(memv)
+        memv = memoryview(octets).cast('B')
+        if bytes(memv[:len(MAGIC)]) != MAGIC:
+            # legacy layout: a single typecode byte followed by the items
+            typecode = chr(memv[0])
+            return cls._frombuffer(memv[1:].cast(typecode))
+        typecode, dimension, count = read_header(memv)
+        if count != 1:
+            raise ValueError(f'expected 1 vector, got {count}; use VectorStore')
+        end = HEADER.size + dimension * struct.calcsize(typecode)
+        return cls._frombuffer(memv[HEADER.size:end].cast(typecode))
+
+
+def read_header(memv):
+    if len(memv) < HEADER.size:
+        raise ValueError('truncated vector header')
+    magic, typecode, dimension, count = HEADER.unpack_from(memv)
+    if magic != MAGIC:
+        raise ValueError(f'bad magic number: {magic!r}')
+    typecode = typecode.decode()
+    if typecode != Vector.typecode:
+        raise ValueError(f'unsupported typecode: {typecode!r}')
+    expected = HEADER.size + dimension * count * struct.calcsize(typecode)
+    if len(memv) < expected:
+        raise ValueError(f'truncated vector data: {len(memv)} < {expected} bytes')
+    return typecode, dimension, count
+
+
+def write_vectors(path, vectors):
+    """Write same-length vectors to ``path``; returns how many were written."""
+    with open(path, 'wb') as fp:
+        fp.write(bytes(HEADER.size))
+        dimension = None
+        count = 0
+        for vector in vectors:
+            components = array(Vector.typecode, vector)
+            if dimension is None:
+                dimension = len(components)
+            elif len(components) != dimension:
+                raise ValueError(f'vector #{count} has {len(components)} '
+                                 f'components, expected {dimension}')
+            components.tofile(fp)
+            count += 1
+        fp.seek(0)
+        fp.write(HEADER.pack(MAGIC, Vector.typecode.encode(), dimension or 0, count))
+    return count
+
+
+class VectorStore:
+    """Read-only, memory-mapped view of a file made by ``write_vectors``.
+
+    Vectors handed out share memory with the mapping, so they must be
+    released before ``close()``.
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as fp:
+            self._mmap = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        memv = memoryview(self._mmap)
+        try:
+            typecode, self.dimension, self._count = read_header(memv)
+            end = HEADER.size + self.dimension * self._count * struct.calcsize(typecode)
+            self._data = memv[HEADER.size:end].cast(typecode)
+        except ValueError:
+            memv.release()
+            self._mmap.close()
+            raise
+        memv.release()
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, index):
+        index = operator.index(index)
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError('VectorStore index out of range')
+        start = index * self.dimension
+        return Vector._frombuffer(self._data[start:start + self.dimension])
+
+    def __iter__(self):
+        return (self[i] for i in range(self._count))
+
+    def matrix(self):
+        return VectorMatrix._frombuffer(self._data, self.dimension)
+
+    def close(self):
+        self._data.release()
+        self._mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class VectorMatrix:
+    """N same-length vectors stored row by row in one flat buffer."""
+
+    typecode = Vector.typecode
+
+    def __init__(self, vectors, dimension=None):
+        data = array(self.typecode)
+        count = 0
+        for vector in vectors:
+            row = _to_array(self.typecode, vector)
+            if dimension is None:
+                dimension = len(row)
+            elif len(row) != dimension:
+                raise ValueError(f'vector #{count} has {len(row)} '
+                                 f'components, expected {dimension}')
+            data.extend(row)
+            count += 1
+        self._data = data
+        self.dimension = dimension or 0
+        self._count = count
+        self._norms = None
+
+    @classmethod
+    def _frombuffer(cls, memv, dimension):
+        matrix = cls.__new__(cls)
+        matrix._data = memv
+        matrix.dimension = dimension
+        matrix._count = len(memv) // dimension if dimension else 0
+        matrix._norms = None
+        return matrix
+
+    def _ndarray(self):
+        if np is None or len(self._data) < NUMPY_THRESHOLD:
+            return None
+        values = np.frombuffer(self._data, dtype=np.float64)
+        return values.reshape(self._count, self.dimension)
+
+    def _rows(self):
+        memv = memoryview(self._data)
+        step = self.dimension
+        if not step:
+            return (memv[:0] for _ in range(self._count))
+        return (memv[i:i + step] for i in range(0, self._count * step, step))
+
+    def _query(self, query):
+        query = _to_array(self.typecode, query)
+        if len(query) != self.dimension:
+            raise ValueError(f'query has {len(query)} components, '
+                             f'expected {self.dimension}')
+        return query
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, index):
+        index = operator.index(index)
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError('VectorMatrix index out of range')
+        start = index * self.dimension
+        memv = memoryview(self._data)[start:start + self.dimension]
+        return Vector._frombuffer(memv)
+
+    def __iter__(self):
+        return (self[i] for i in range(self._count))
+
+    def dot(self, query):
+        """Return ``row @ query`` for every row."""
+        query = self._query(query)
+        if (values := self._ndarray()) is not None:
+            return array(self.typecode, (values @ np.frombuffer(query)).tobytes())
+        return array(self.typecode,
+                     (sum(map(operator.mul, row, query)) for row in self._rows()))
+
+    def norms(self):
+        """Return ``abs(row)`` for every row; computed once and cached."""
+        if self._norms is None:
+            if (values := self._ndarray()) is not None:
+                norms = np.linalg.norm(values, axis=1).tobytes()
+            else:
+                norms = (math.hypot(*row) for row in self._rows())
+            self._norms = array(self.typecode, norms)
+        return self._norms
+
+    def cosine(self, query):
+        """Return the cosine similarity of every row to ``query``.
+
+        Rows or queries with zero length have a similarity of 0.0.
+        """
+        query = self._query(query)
+        query_norm = math.hypot(*query)
+        if (values := self._ndarray()) is not None:
+            denominators = np.frombuffer(self.norms()) * query_norm
+            dots = values @ np.frombuffer(query)
+            sims = np.divide(dots, denominators,
+                             out=np.zeros_like(dots), where=denominators != 0)
+            return array(self.typecode, sims.tobytes())
+        sims = array(self.typecode)
+        for dot, norm in zip(self.dot(query), self.norms()):
+            denominator = norm * query_norm
+            sims.append(dot / denominator if denominator else 0.0)
+        return sims
+
+    def angles(self, query):
+        """Return the angle in radians between every row and ``query``."""
+        return array(self.typecode, (math.acos(max(-1.0, min(1.0, c)))
+                                     for c in self.cosine(query)))
+
+    def nearest(self, query, k=1):
+        """Return up to ``k`` (index, similarity) pairs, most similar first."""
+        if k <= 0:
+            return []
+        sims = self.cosine(query)
+        if np is not None and len(sims) >= NUMPY_THRESHOLD:
+            values = np.frombuffer(sims)
+            k = min(k, len(values))
+            top = np.argpartition(values, -k)[-k:]
+            top = top[np.argsort(values[top])[::-1]]
+            return [(int(i), float(values[i])) for i in top]
+        return heapq.nlargest(k, enumerate(sims), key=operator.itemgetter(1))
 
 
 if __name__ == '__main__':
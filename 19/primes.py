@@ -1,12 +1,49 @@
+import functools
+import itertools
 import math
+from array import array
+from collections.abc import Callable, Iterable, Iterator
+from time import perf_counter
 
 NUMBERS = [2, 142702110479723, 299593572317531, 3333333333333301, 3333333333333333, 3333335652092209, 4444444444444423,
            4444444444444444, 4444444488888889, 5555553133149889, 5555555555555503, 5555555555555555, 6666666666666666,
            6666666666666719, 6666667141414921, 7777777536340681, 7777777777777753, 7777777777777777, 9999999999999917,
            9999999999999999]
 
+# Miller-Rabin with the first 12 primes as bases is deterministic for every
+# n below MR_LIMIT, which covers all 64-bit integers
+MR_BASES = (2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37)
+MR_LIMIT = 318_665_857_834_031_151_167_461
+SIEVE_LIMIT = 1000
+# odd numbers per primes_in_range segment: a bytearray of this size
+SEGMENT_SIZE = 1 << 24
+# trial division asks whether it should give up once per CHECK_INTERVAL
+# divisors (a few milliseconds), keeping the inner loop as it was
+CHECK_INTERVAL = 1 << 16
 
-def is_prime(n: int) -> bool:
+# called by engines to learn if they should give up
+Expired = Callable[[], bool]
+
+
+class Undecided(Exception):
+    """An engine gave up on ``n`` because its ``expired`` callback said so."""
+
+
+def deadline(seconds: float | None = None,
+             cancelled: Expired | None = None) -> Expired | None:
+    """An ``expired`` callback for engines: true once ``seconds`` have passed
+    or ``cancelled()`` returns true."""
+    if seconds is None:
+        return cancelled
+    limit = perf_counter() + seconds
+
+    def expired() -> bool:
+        return perf_counter() >= limit or (cancelled is not None and cancelled())
+
+    return expired
+
+
+def is_prime(n: int, expired: Expired | None = None) -> bool:
     if n < 2:
         return False
 
@@ -17,8 +54,116 @@ def is_prime(n: int) -> bool:
         return False
 
     root = math.isqrt(n)
-    for i in range(3, root + 1, 2):
-        if n % i == 0:
-            return False
+    block = 2 * CHECK_INTERVAL if expired else root + 1
+    for start in range(3, root + 1, block):
+        if expired and expired():
+            raise Undecided(n)
+        for i in range(start, min(start + block, root + 1), 2):
+            if n % i == 0:
+                return False
 
     return True
+
+
+def small_primes(limit: int) -> list[int]:
+    """Primes below ``limit``, by the sieve of Eratosthenes."""
+    sieve = bytearray([1]) * limit
+    sieve[:2] = b'\0\0'
+    for i in range(2, math.isqrt(limit - 1) + 1):
+        if sieve[i]:
+            sieve[i * i::i] = bytes(len(range(i * i, limit, i)))
+    return [i for i, flag in enumerate(sieve) if flag]
+
+
+SMALL_PRIMES = small_primes(SIEVE_LIMIT)
+
+
+def is_prime_mr(n: int, expired: Expired | None = None) -> bool:
+    """Deterministic Miller-Rabin after trial division by SMALL_PRIMES."""
+    for p in SMALL_PRIMES:
+        if n % p == 0:
+            return n == p
+    if n < SIEVE_LIMIT * SIEVE_LIMIT:
+        return n > 1
+    if n >= MR_LIMIT:
+        return is_prime(n, expired)
+
+    d = n - 1
+    s = (d & -d).bit_length() - 1
+    d >>= s
+    for a in MR_BASES:
+        x = pow(a, d, n)
+        if x == 1 or x == n - 1:
+            continue
+        for _ in range(s - 1):
+            x = x * x % n
+            if x == n - 1:
+                break
+        else:
+            return False
+    return True
+
+
+# called as engine(n) or engine(n, expired)
+Engine = Callable[..., bool]
+
+ENGINES: dict[str, Engine] = {
+    'trial': is_prime,
+    'mr': is_prime_mr,
+}
+DEFAULT_ENGINE = 'trial'
+
+
+def is_prime_many(numbers: Iterable[int],
+                  engine: Callable[[int], bool] = is_prime_mr) -> list[bool]:
+    """Primality of each of ``numbers``; repeated numbers are checked once."""
+    numbers = list(numbers)
+    found = {n: engine(n) for n in set(numbers)}
+    return [found[n] for n in numbers]
+
+
+@functools.lru_cache(maxsize=4)
+def base_primes(limit: int) -> array:
+    """Primes up to ``limit``, inclusive."""
+    if limit < SIEVE_LIMIT:
+        return array('Q', small_primes(limit + 1))
+    found = array('Q')
+    for segment in segments(2, limit + 1):
+        found.extend(sieve_segment(*segment))
+    return found
+
+
+def sieve_segment(lo: int, hi: int) -> array:
+    """Primes in ``range(lo, hi)``, by sieving its odd numbers with
+    ``base_primes`` up to ``isqrt(hi - 1)``; ``hi`` must not exceed 2**64."""
+    found = array('Q', [2] if lo <= 2 < hi else [])
+    first = max(lo, 3) | 1
+    if first >= hi:
+        return found
+    size = (hi - first + 1) // 2
+    flags = bytearray([1]) * size
+    # flags[i] stands for first + 2 * i
+    for p in itertools.islice(base_primes(math.isqrt(hi - 1)), 1, None):
+        square = p * p
+        if square >= hi:
+            break
+        if square > first:
+            start = (square - first) >> 1
+        else:
+            # first + 2 * start == 0 (mod p); (p + 1) / 2 is the inverse of 2
+            start = (p - first % p) * ((p + 1) >> 1) % p
+        if start < size:
+            flags[start::p] = bytes((size - 1 - start) // p + 1)
+    found.extend(itertools.compress(range(first, hi, 2), flags))
+    return found
+
+
+def segments(a: int, b: int, size: int = SEGMENT_SIZE) -> Iterator[tuple[int, int]]:
+    """Bounds of the segments of ``range(a, b)`` holding ``size`` odd numbers."""
+    return ((lo, min(lo + 2 * size, b)) for lo in range(a, b, 2 * size))
+
+
+def primes_in_range(a: int, b: int, size: int = SEGMENT_SIZE) -> Iterator[int]:
+    """Primes in ``range(a, b)`` in order, one sieved segment at a time."""
+    for segment in segments(a, b, size):
+        yield from sieve_segment(*segment)
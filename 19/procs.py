@@ -1,75 +1,258 @@
-import sys
+import argparse
+import os
+import signal
+from array import array
+from collections.abc import Iterable, Iterator
+from ctypes import c_bool
 from time import perf_counter
 from typing import NamedTuple
-from multiprocessing import Process, SimpleQueue, cpu_count
+from multiprocessing import Process, Queue, RawValue, SimpleQueue, cpu_count
 from multiprocessing import queues
 
-from primes import is_prime, NUMBERS
+from primes import (is_prime, deadline, DEFAULT_ENGINE, ENGINES, NUMBERS,
+                    Engine, Expired, Undecided)
+from resultcache import ResultCache
+from schedule import ChunkSizer, Utilization, lpt_order
+
+# Numbers are sent most expensive first, in chunks sized by ChunkSizer.
+# At most CHUNKS_PER_PROC chunks per worker wait in the shared job queue, so
+# it stays small for any input size, and whichever worker is idle takes the
+# next one: a huge number at the end cannot leave the others waiting.
+CHUNKS_PER_PROC = 2
+# per-number output is printed for inputs up to this size
+PRINT_LIMIT = 100
+# seconds workers get to exit after the parent fails, before they are killed
+STOP_TIMEOUT = 1.0
 
 
 class PrimeResult(NamedTuple):
     n: int
-    prime: bool
+    # None when the engine gave up
+    prime: bool | None
     elapsed: float
+    cached: bool = False
 
 
-JobQueue = queues.SimpleQueue[int]
-ResultQueue = queues.SimpleQueue[PrimeResult]
+# Wire format: a job is the numbers of a chunk packed as uint64; a result
+# batch is the worker's pid and busy seconds, the same numbers, a uint8 of
+# flags (PRIME, CACHED, UNDECIDED) per number and a float64 elapsed time per number.
+# Empty jobs and batches mean "no more".
+Batch = tuple[int, float, bytes, bytes, bytes]
+JobQueue = queues.Queue  # of bytes; not subscriptable at runtime
+ResultQueue = queues.SimpleQueue[Batch]
+PRIME, CACHED, UNDECIDED = 1, 2, 4
 
 
-def check(n: int) -> PrimeResult:
+def check(n: int, engine: Engine = is_prime, cache: ResultCache | None = None,
+          expired: Expired | None = None) -> PrimeResult:
     t0 = perf_counter()
-    res = is_prime(n)
-    return PrimeResult(n, res, perf_counter() - t0)
+    if cache is not None and (res := cache.get(n)) is not None:
+        return PrimeResult(n, res, perf_counter() - t0, True)
+    try:
+        res = engine(n, expired)
+    except Undecided:
+        return PrimeResult(n, None, perf_counter() - t0)
+    elapsed = perf_counter() - t0
+    if cache is not None:
+        cache.put(n, res)
+    return PrimeResult(n, res, elapsed)
 
 
-def worker(jobs: JobQueue, results: ResultQueue):
-    while n := jobs.get():
-        results.put(check(n))
-    results.put(PrimeResult(0, False, 0.0))
+def check_chunk(job: bytes, engine: Engine = is_prime,
+                cache: ResultCache | None = None, timeout: float | None = None,
+                cancelled: Expired | None = None) -> Batch:
+    t0 = perf_counter()
+    flags = bytearray()
+    times = array('d')
+    for n in array('Q', job):
+        _, prime, elapsed, cached = check(n, engine, cache,
+                                          deadline(timeout, cancelled))
+        flags.append(UNDECIDED if prime is None else
+                     prime * PRIME | cached * CACHED)
+        times.append(elapsed)
+    if cache is not None:
+        cache.flush()
+    return os.getpid(), perf_counter() - t0, job, bytes(flags), times.tobytes()
 
 
-def start_jobs(
-        procs: int, jobs: JobQueue, results: ResultQueue
-) -> None:
-    for n in NUMBERS:
-        jobs.put(n)
+def unpack(batch: Batch) -> Iterator[PrimeResult]:
+    _, _, numbers, flags, times = batch
+    primes = (None if f & UNDECIDED else bool(f & PRIME) for f in flags)
+    return map(PrimeResult, array('Q', numbers), primes, array('d', times),
+               (bool(f & CACHED) for f in flags))
+
+
+def worker(jobs: JobQueue, results: ResultQueue, engine: Engine = is_prime,
+           cache_path: str | None = None, timeout: float | None = None,
+           cancel: c_bool | None = None):
+    # Ctrl+C reaches the whole process group; the parent sets ``cancel``
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    cache = ResultCache(cache_path) if cache_path else None
+    cancelled = None if cancel is None else lambda: cancel.value
+    while job := jobs.get():
+        results.put(check_chunk(job, engine, cache, timeout, cancelled))
+    if cache is not None:
+        cache.close()
+    results.put((os.getpid(), 0.0, b'', b'', b''))
+
+
+class Dispatcher:
+    """Feeds chunks of ``numbers`` to ``procs`` workers as they free up."""
+
+    def __init__(self, numbers: Iterable[int], procs: int, jobs: JobQueue,
+                 cancel: c_bool | None = None):
+        self.numbers = iter(numbers)
+        self.procs = procs
+        self.jobs = jobs
+        self.cancel = cancel
+        self.sizer = ChunkSizer()
+        self.utilization = Utilization()
+        self.pending = 0
+        self.exhausted = False
+
+    def feed(self) -> None:
+        while not self.exhausted and self.pending < self.procs * CHUNKS_PER_PROC:
+            if self.cancel is not None and self.cancel.value:
+                chunk = []
+            else:
+                chunk = self.sizer.take(self.numbers)
+            if chunk:
+                self.jobs.put(array('Q', chunk).tobytes())
+                self.pending += 1
+            else:
+                self.exhausted = True
+                for _ in range(self.procs):
+                    self.jobs.put(b'')
 
+    def done(self, batch: Batch) -> None:
+        self.pending -= 1
+        pid, busy, numbers, _, _ = batch
+        numbers = array('Q', numbers)
+        self.sizer.observe(numbers, busy)
+        self.utilization.record(pid, len(numbers), busy)
+        self.feed()
+
+
+def start_jobs(
+        procs: int, jobs: JobQueue, results: ResultQueue,
+        engine: Engine = is_prime, cache_path: str | None = None,
+        timeout: float | None = None, cancel: c_bool | None = None
+) -> list[Process]:
+    workers = []
     for _ in range(procs):
-        proc = Process(target=worker, args=(jobs, results))
+        proc = Process(target=worker, args=(jobs, results, engine, cache_path,
+                                            timeout, cancel))
         proc.start()
-        jobs.put(0)
+        workers.append(proc)
+    return workers
+
+
+def stop_jobs(workers: list[Process], jobs: JobQueue, cancel: c_bool) -> None:
+    """Make ``workers`` exit after the parent failed, killing any that do
+    not within STOP_TIMEOUT: they ignore Ctrl+C, and nobody reads their
+    results anymore."""
+    cancel.value = True
+    for _ in workers:
+        jobs.put(b'')
+    limit = perf_counter() + STOP_TIMEOUT
+    for proc in workers:
+        proc.join(max(limit - perf_counter(), 0))
+        if proc.is_alive():
+            proc.terminate()
+            proc.join()
+    # the workers may be gone before reading every queued job
+    jobs.cancel_join_thread()
+
+
+def cancel_on_interrupt(cancel: c_bool) -> None:
+    """Make the first Ctrl+C set ``cancel``, and a second one interrupt."""
+    def handler(signum, frame):
+        cancel.value = True
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+
+    signal.signal(signal.SIGINT, handler)
+
+
+def process_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description='Check NUMBERS for primality with worker processes.')
+    parser.add_argument('procs', nargs='?', type=int, default=cpu_count(),
+                        help='number of worker processes (default: CPU count)')
+    parser.add_argument(
+        '-e', '--engine', choices=ENGINES, default=DEFAULT_ENGINE,
+        help=f'primality test to use (default={DEFAULT_ENGINE})')
+    parser.add_argument(
+        '-r', '--range', metavar=('START', 'STOP'), type=int, nargs=2,
+        help='check every number in range(START, STOP) instead of NUMBERS')
+    parser.add_argument(
+        '-c', '--cache', metavar='PATH',
+        help='reuse and store results in the sqlite database at PATH')
+    parser.add_argument(
+        '-t', '--timeout', metavar='SECONDS', type=float,
+        help='give up on a number after SECONDS, reporting it as undecided')
+    args = parser.parse_args()
+    if args.range and not 0 <= args.range[0] <= args.range[1] <= 2 ** 64:
+        # jobs pack numbers as uint64
+        parser.error('--range needs 0 <= START <= STOP <= 2**64')
+    return args
 
 
 def main():
-    if len(sys.argv) < 2:
-        procs = cpu_count()
-    else:
-        procs = int(sys.argv[1])
+    args = process_args()
+    procs = args.procs
+    numbers = range(*args.range) if args.range else NUMBERS
 
-    print(f'Checking {len(NUMBERS)} numbers with {procs} processes:')
+    print(f'Checking {len(numbers)} numbers with {procs} processes '
+          f'and {args.engine}:')
     t0 = perf_counter()
-    jobs: JobQueue = SimpleQueue()
+    # Queue.put never blocks, so a big job cannot deadlock against results
+    jobs: JobQueue = Queue()
     results: ResultQueue = SimpleQueue()
+    # set on Ctrl+C: workers give up on their current numbers and the
+    # dispatcher stops sending new ones
+    cancel = RawValue(c_bool, False)
+    cancel_on_interrupt(cancel)
 
-    start_jobs(procs, jobs, results)
-    checked = report(procs, results)
+    workers = start_jobs(procs, jobs, results, ENGINES[args.engine],
+                         args.cache, args.timeout, cancel)
+    try:
+        dispatcher = Dispatcher(lpt_order(numbers), procs, jobs, cancel)
+        dispatcher.feed()
+        checked, primes, hits, undecided = report(
+            procs, results, dispatcher, verbose=len(numbers) <= PRINT_LIMIT)
+    except BaseException:
+        stop_jobs(workers, jobs, cancel)
+        raise
     elapsed = perf_counter() - t0
-    print(f'{checked} checks in {elapsed:2f}s')
+    if cancel.value:
+        print(f'Cancelled after {checked} of {len(numbers)} checks')
+    print(f'{checked} checks, {primes} primes in {elapsed:2f}s')
+    if undecided:
+        print(f'{undecided} undecided: time budget exceeded or cancelled')
+    if args.cache:
+        print(f'Cache: {hits} hits, {checked - hits} misses')
+    dispatcher.utilization.report(elapsed, procs)
 
 
-def report(procs: int, results: ResultQueue) -> int:
-    checked = 0
+def report(procs: int, results: ResultQueue, dispatcher: Dispatcher,
+           verbose: bool = True) -> tuple[int, int, int, int]:
+    checked = primes = hits = undecided = 0
     procs_done = 0
     while procs_done < procs:
-        n, prime, elapsed = results.get()
-        if n == 0:
+        batch = results.get()
+        if not batch[2]:
             procs_done += 1
-        else:
+            continue
+        dispatcher.done(batch)
+        for n, prime, elapsed, cached in unpack(batch):
             checked += 1
-            label = f'P' if prime else ''
-            print(f'{n:16} {label} {elapsed:9.6f}s')
-    return checked
+            primes += bool(prime)
+            hits += cached
+            undecided += prime is None
+            if verbose:
+                label = '?' if prime is None else 'P' if prime else ''
+                print(f'{n:16} {label} {elapsed:9.6f}s')
+    return checked, primes, hits, undecided
 
 
 if __name__ == '__main__':
@@ -0,0 +1,100 @@
+"""Primality results remembered across runs and worker processes.
+
+Results live in an sqlite database, in WAL mode so any number of processes
+can read it while one of them writes; each process keeps its own connection
+and a small LRU of the results it has seen. New results are written in
+batches, every FLUSH_SIZE results or FLUSH_INTERVAL seconds.
+"""
+
+import os
+import sqlite3
+from collections import OrderedDict
+from time import monotonic
+
+CACHE_SIZE = 4096
+FLUSH_SIZE = 256
+FLUSH_INTERVAL = 1.0
+# seconds a writer waits for another one to finish
+LOCK_TIMEOUT = 30.0
+# sqlite integers are signed 64-bit; other numbers are never cached
+MIN_KEY, MAX_KEY = -(1 << 63), (1 << 63) - 1
+
+SCHEMA = 'CREATE TABLE IF NOT EXISTS results (n INTEGER PRIMARY KEY, prime INTEGER NOT NULL)'
+
+
+class ResultCache:
+    """Primality of numbers by ``n``, stored in the sqlite file at ``path``."""
+
+    def __init__(self, path: str, maxsize: int = CACHE_SIZE):
+        self.path = path
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._memory: OrderedDict[int, bool] = OrderedDict()
+        self._unsaved: dict[int, bool] = {}
+        self._last_flush = monotonic()
+        self._db: sqlite3.Connection | None = None
+        self._pid = 0
+
+    def __enter__(self) -> 'ResultCache':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        # a connection must not cross a fork, so each process opens its own
+        if self._db is None or self._pid != os.getpid():
+            db = sqlite3.connect(self.path, timeout=LOCK_TIMEOUT)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            with db:
+                db.execute(SCHEMA)
+            self._db, self._pid = db, os.getpid()
+        return self._db
+
+    def _remember(self, n: int, prime: bool) -> None:
+        self._memory[n] = prime
+        self._memory.move_to_end(n)
+        if len(self._memory) > self.maxsize:
+            self._memory.popitem(last=False)
+
+    def get(self, n: int) -> bool | None:
+        """Primality of ``n`` if it was stored before, else None."""
+        prime = self._memory.get(n)
+        if prime is None and MIN_KEY <= n <= MAX_KEY:
+            row = self._connect().execute(
+                'SELECT prime FROM results WHERE n = ?', (n,)).fetchone()
+            if row is not None:
+                prime = bool(row[0])
+        if prime is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._remember(n, prime)
+        return prime
+
+    def put(self, n: int, prime: bool) -> None:
+        self._remember(n, prime)
+        if MIN_KEY <= n <= MAX_KEY:
+            self._unsaved[n] = prime
+        if (len(self._unsaved) >= FLUSH_SIZE
+                or monotonic() - self._last_flush >= FLUSH_INTERVAL):
+            self.flush()
+
+    def flush(self) -> None:
+        """Write the results stored since the last flush to disk."""
+        self._last_flush = monotonic()
+        if not self._unsaved:
+            return
+        db = self._connect()
+        with db:
+            db.executemany('INSERT OR REPLACE INTO results VALUES (?, ?)',
+                           self._unsaved.items())
+        self._unsaved.clear()
+
+    def close(self) -> None:
+        self.flush()
+        if self._db is not None and self._pid == os.getpid():
+            self._db.close()
+        self._db = None
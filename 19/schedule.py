@@ -0,0 +1,84 @@
+"""Longest-processing-time-first chunking of primality checks."""
+
+import math
+from collections.abc import Collection, Iterator
+
+# chunks hold about CHUNK_TIME seconds of estimated work
+CHUNK_TIME = 0.05
+MAX_CHUNK = 1 << 16
+
+
+def estimate_cost(n: int) -> int:
+    """Odd divisors trial division tries to prove ``n`` prime: the worst case.
+
+    Other engines cost less, but also grow with ``n``; the rate measured by
+    ChunkSizer turns these units into seconds.
+    """
+    return math.isqrt(n) // 2 + 1
+
+
+def lpt_order(numbers: Collection[int]) -> Iterator[int]:
+    """``numbers`` from the most to the least expensive to check."""
+    # estimate_cost never decreases as n grows
+    if isinstance(numbers, range) and numbers.step > 0:
+        return reversed(numbers)
+    return iter(sorted(numbers, reverse=True))
+
+
+class ChunkSizer:
+    """Cuts chunks of about ``target`` seconds of work from a stream of numbers.
+
+    A chunk is at most twice as long as the longest one measured so far, so
+    a misleading first measurement cannot produce a huge chunk.
+    """
+
+    def __init__(self, target: float = CHUNK_TIME, max_size: int = MAX_CHUNK):
+        self.target = target
+        self.max_size = max_size
+        self.cost = 0
+        self.seconds = 0.0
+        self.longest = 0
+
+    def observe(self, numbers: Collection[int], seconds: float) -> None:
+        self.cost += sum(map(estimate_cost, numbers))
+        self.seconds += seconds
+        self.longest = max(self.longest, len(numbers))
+
+    def take(self, numbers: Iterator[int]) -> list[int]:
+        if self.seconds:
+            budget = self.target * self.cost / self.seconds
+        else:
+            budget = math.inf
+        size = min(self.max_size, 2 * self.longest or 1)
+        chunk: list[int] = []
+        total = 0
+        for n in numbers:
+            chunk.append(n)
+            total += estimate_cost(n)
+            if total >= budget or len(chunk) >= size:
+                break
+        return chunk
+
+
+class Utilization:
+    """Chunks, numbers and busy seconds of each worker process."""
+
+    def __init__(self):
+        self.workers: dict[int, list] = {}
+
+    def record(self, pid: int, count: int, busy: float) -> None:
+        usage = self.workers.setdefault(pid, [0, 0, 0.0])
+        usage[0] += 1
+        usage[1] += count
+        usage[2] += busy
+
+    def report(self, elapsed: float, procs: int) -> None:
+        print(f'{"worker":>8} {"chunks":>7} {"numbers":>9} {"busy":>10} {"use":>5}')
+        for pid, (chunks, count, busy) in sorted(self.workers.items()):
+            use = busy / elapsed if elapsed else 0.0
+            print(f'{pid:8} {chunks:7} {count:9} {busy:9.3f}s {use:5.0%}')
+        if self.workers:
+            busy = sum(usage[2] for usage in self.workers.values())
+            ideal = busy / procs
+            print(f'busy {busy:.3f}s in total, {ideal:.3f}s per worker if '
+                  f'perfectly balanced, {elapsed:.3f}s wall clock')
@@ -1,30 +1,65 @@
+import argparse
 from time import perf_counter
 from typing import NamedTuple
 
-from primes import is_prime, NUMBERS
+from primes import (is_prime, deadline, DEFAULT_ENGINE, ENGINES, NUMBERS,
+                    Engine, Expired, Undecided)
+from resultcache import ResultCache
 
 
 class Result(NamedTuple):
-    prime: bool
+    # None when the engine gave up
+    prime: bool | None
     elapsed: float
+    cached: bool = False
 
 
-def check(n: int) -> Result:
+def check(n: int, engine: Engine = is_prime, cache: ResultCache | None = None,
+          expired: Expired | None = None) -> Result:
     t0 = perf_counter()
-    prime = is_prime(n)
-    return Result(prime, perf_counter() - t0)
+    if cache is not None and (prime := cache.get(n)) is not None:
+        return Result(prime, perf_counter() - t0, True)
+    try:
+        prime = engine(n, expired)
+    except Undecided:
+        return Result(None, perf_counter() - t0)
+    elapsed = perf_counter() - t0
+    if cache is not None:
+        cache.put(n, prime)
+    return Result(prime, elapsed)
+
+
+def process_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Check NUMBERS for primality.')
+    parser.add_argument(
+        '-e', '--engine', choices=ENGINES, default=DEFAULT_ENGINE,
+        help=f'primality test to use (default={DEFAULT_ENGINE})')
+    parser.add_argument(
+        '-c', '--cache', metavar='PATH',
+        help='reuse and store results in the sqlite database at PATH')
+    parser.add_argument(
+        '-t', '--timeout', metavar='SECONDS', type=float,
+        help='give up on a number after SECONDS, reporting it as undecided')
+    return parser.parse_args()
 
 
 def main():
-    print(f'Checcking {len(NUMBERS)} numbers sequentially:')
+    args = process_args()
+    engine = ENGINES[args.engine]
+    print(f'Checking {len(NUMBERS)} numbers sequentially with {args.engine}:')
     t0 = perf_counter()
+    cache = ResultCache(args.cache) if args.cache else None
     for n in NUMBERS:
-        prime, elapsed = check(n)
-        label = 'P' if prime else ''
+        prime, elapsed, _ = check(n, engine, cache, deadline(args.timeout))
+        label = '?' if prime is None else 'P' if prime else ''
         print(f'{n:16} {label} {elapsed:9.6f}s')
+    if cache is not None:
+        cache.close()
 
     elapsed = perf_counter() - t0
     print(f'Total time: {elapsed:9.6f}s')
+    if cache is not None:
+        print(f'Cache: {cache.hits} hits, {cache.misses} misses')
 
 
 if __name__ == '__main__':
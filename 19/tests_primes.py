@@ -0,0 +1,112 @@
+import random
+import time
+
+import pytest
+
+import procs
+import sequential
+from primes import (NUMBERS, SIEVE_LIMIT, Undecided, base_primes, deadline,
+                    is_prime, is_prime_many, is_prime_mr, primes_in_range,
+                    sieve_segment, small_primes)
+from resultcache import ResultCache
+
+
+def test_small_primes():
+    assert small_primes(30) == [2, 3, 5, 7, 11, 13, 17, 19, 23, 29]
+    assert small_primes(2) == []
+
+
+def test_mr_matches_trial_division():
+    for n in range(-5, 200_000):
+        assert is_prime_mr(n) == is_prime(n), n
+
+
+@pytest.mark.parametrize('n, prime', [
+    (SIEVE_LIMIT ** 2 + 3, True),
+    (2 ** 61 - 1, True),
+    (2 ** 64 - 59, True),  # the largest prime below 2**64
+    (3_215_031_751, False),  # strong pseudoprime to bases 2, 3, 5 and 7
+    (3_825_123_056_546_413_051, False),  # ... to every prime base up to 23
+    (561, False),  # Carmichael number
+    (1009 * 1013, False),
+])
+def test_mr_known_numbers(n, prime):
+    assert is_prime_mr(n) == prime
+
+
+def test_mr_agrees_on_numbers():
+    small = [n for n in NUMBERS if n < 10 ** 15]
+    assert is_prime_many(small) == [is_prime(n) for n in small]
+    assert is_prime_many(NUMBERS) == is_prime_many(NUMBERS * 2)[:len(NUMBERS)]
+
+
+def test_base_primes():
+    assert list(base_primes(1)) == []
+    assert list(base_primes(2)) == [2]
+    assert list(base_primes(30)) == small_primes(31)
+    assert list(base_primes(5000)) == small_primes(5001)
+
+
+@pytest.mark.parametrize('a, b', [(0, 0), (0, 3), (2, 3), (1, 2), (3, 4),
+                                  (-10, 50), (9, 9), (4, 5)])
+def test_sieve_segment_edges(a, b):
+    assert list(sieve_segment(a, b)) == [n for n in range(a, b) if is_prime(n)]
+
+
+@pytest.mark.parametrize('size', [1, 2, 3, 7, 64, 999, 1 << 12])
+def test_primes_in_range_matches_mr(size):
+    rnd = random.Random(size)
+    for _ in range(20):
+        starts = [0, 1, 2, rnd.randrange(100_000)]
+        if size >= 64:  # tiny segments at large offsets are slow to sieve
+            starts.append(rnd.randrange(10 ** 12))
+        a = rnd.choice(starts)
+        b = a + rnd.randrange(3000)
+        expected = [n for n in range(a, b) if is_prime_mr(n)]
+        assert list(primes_in_range(a, b, size)) == expected, (a, b)
+
+
+def test_sieve_segment_at_large_offsets():
+    a = 10 ** 14
+    assert list(sieve_segment(a, a + 2000)) == [
+        n for n in range(a, a + 2000) if is_prime_mr(n)]
+
+
+def test_expired_engine_is_undecided():
+    n = 1_000_003
+    with pytest.raises(Undecided):
+        is_prime(n, lambda: True)
+    assert is_prime(n, lambda: False)
+    # numbers settled before any divisor is tried never ask
+    assert is_prime(2, lambda: True) and not is_prime(10, lambda: True)
+
+
+def test_deadline_combines_time_and_cancellation():
+    cancel = False
+
+    def cancelled():
+        return cancel
+
+    assert deadline() is None
+    assert deadline(cancelled=cancelled) is cancelled
+    expired = deadline(60, cancelled)
+    assert not expired()
+    cancel = True
+    assert expired()
+    cancel = False
+    expired = deadline(0.01, cancelled)
+    time.sleep(0.02)
+    assert expired()
+    assert deadline(0)()
+
+
+@pytest.mark.parametrize('module', [sequential, procs])
+def test_undecided_checks_are_not_cached(tmp_path, module):
+    n = 1_000_003
+    with ResultCache(tmp_path / 'cache.db') as cache:
+        result = module.check(n, is_prime, cache, lambda: True)
+        assert result.prime is None and not result.cached
+        assert cache.get(n) is None
+        result = module.check(n, is_prime, cache, deadline(60))
+        assert result.prime is True and not result.cached
+        assert module.check(n, is_prime, cache, lambda: True).cached
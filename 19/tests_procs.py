@@ -0,0 +1,38 @@
+import os
+from array import array
+
+from primes import is_prime, is_prime_mr
+from procs import CACHED, PRIME, UNDECIDED, PrimeResult, check_chunk, unpack
+from resultcache import ResultCache
+
+
+def pack(numbers):
+    return array('Q', numbers).tobytes()
+
+
+def test_check_chunk_round_trip(tmp_path):
+    numbers = [2, 4, 97, 100, 1_000_003, 2 ** 64 - 59]
+    with ResultCache(tmp_path / 'cache.db') as cache:
+        cache.put(97, True)
+        cache.put(100, False)
+        batch = check_chunk(pack(numbers), is_prime_mr, cache)
+    pid, busy, job, flags, _ = batch
+    assert (pid, job) == (os.getpid(), pack(numbers))
+    assert flags == bytes([PRIME, 0, PRIME | CACHED, CACHED, PRIME, PRIME])
+    results = list(unpack(batch))
+    assert all(isinstance(r, PrimeResult) and r.elapsed >= 0 for r in results)
+    assert sum(r.elapsed for r in results) <= busy
+    assert [(r.n, r.prime, r.cached) for r in results] == [
+        (2, True, False), (4, False, False), (97, True, True),
+        (100, False, True), (1_000_003, True, False), (2 ** 64 - 59, True, False)]
+
+
+def test_check_chunk_marks_undecided(tmp_path):
+    numbers = [2, 4, 9, 15, 1_000_003]
+    with ResultCache(tmp_path / 'cache.db') as cache:
+        cache.put(15, False)
+        batch = check_chunk(pack(numbers), is_prime, cache, cancelled=lambda: True)
+    assert batch[3] == bytes([PRIME, 0, UNDECIDED, CACHED, UNDECIDED])
+    assert [(r.n, r.prime, r.cached) for r in unpack(batch)] == [
+        (2, True, False), (4, False, False), (9, None, False),
+        (15, False, True), (1_000_003, None, False)]
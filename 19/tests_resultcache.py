@@ -0,0 +1,80 @@
+import sqlite3
+from multiprocessing import Pool
+
+from primes import is_prime_mr
+from resultcache import FLUSH_SIZE, ResultCache
+from sequential import check
+
+
+def stored(path):
+    """Results on disk, as written by every connection so far."""
+    with sqlite3.connect(path) as db:
+        if not db.execute("SELECT name FROM sqlite_master WHERE name = 'results'").fetchone():
+            return {}
+        return dict(db.execute('SELECT n, prime FROM results'))
+
+
+def test_get_put_and_counts(tmp_path):
+    path = tmp_path / 'cache.db'
+    with ResultCache(path) as cache:
+        assert cache.get(7) is None
+        cache.put(7, True)
+        cache.put(8, False)
+        assert cache.get(7) is True
+        assert cache.get(8) is False
+        assert (cache.hits, cache.misses) == (2, 1)
+    with ResultCache(path) as cache:
+        assert cache.get(7) is True and cache.get(9) is None
+    assert stored(path) == {7: 1, 8: 0}
+
+
+def test_lru_is_bounded_and_falls_back_to_disk(tmp_path):
+    path = tmp_path / 'cache.db'
+    with ResultCache(path, maxsize=10) as cache:
+        for n in range(100):
+            cache.put(n, is_prime_mr(n))
+        cache.flush()
+        assert len(cache._memory) == 10
+        assert [cache.get(n) for n in range(100)] == [is_prime_mr(n) for n in range(100)]
+
+
+def test_writes_in_batches(tmp_path):
+    path = tmp_path / 'cache.db'
+    cache = ResultCache(path)
+    cache._last_flush = float('inf')  # only the batch size triggers a flush
+    for n in range(FLUSH_SIZE - 1):
+        cache.put(n, False)
+    assert stored(path) == {}
+    cache.put(FLUSH_SIZE, True)
+    assert len(stored(path)) == FLUSH_SIZE
+    cache.close()
+
+
+def test_numbers_beyond_sqlite_integers_stay_in_memory(tmp_path):
+    path = tmp_path / 'cache.db'
+    with ResultCache(path) as cache:
+        cache.put(2 ** 64 - 59, True)
+        assert cache.get(2 ** 64 - 59) is True
+    assert stored(path) == {}
+
+
+def fill(args):
+    path, start = args
+    with ResultCache(path) as cache:
+        for n in range(start, start + 3000):
+            if cache.get(n) is None:
+                cache.put(n, is_prime_mr(n))
+    return cache.hits
+
+
+def test_concurrent_writers(tmp_path):
+    path = tmp_path / 'cache.db'
+    with Pool(4) as pool:
+        pool.map(fill, [(path, start) for start in range(0, 4000, 500)])
+    assert stored(path) == {n: is_prime_mr(n) for n in range(6500)}
+
+
+def test_check_uses_cache(tmp_path):
+    with ResultCache(tmp_path / 'cache.db') as cache:
+        assert check(97, is_prime_mr, cache)[::2] == (True, False)
+        assert check(97, is_prime_mr, cache)[::2] == (True, True)
@@ -1,44 +1,152 @@
-import sys
+import argparse
+import os
+import signal
 from concurrent import futures
+from ctypes import c_bool
+from multiprocessing import RawValue
 from time import perf_counter
 from typing import NamedTuple
 
-from primes import is_prime, NUMBERS
+from primes import (is_prime, deadline, DEFAULT_ENGINE, ENGINES, NUMBERS,
+                    Engine, Expired, Undecided)
+from resultcache import ResultCache
+from schedule import ChunkSizer, Utilization, lpt_order
+
+# chunks submitted ahead per worker; idle workers take whichever is next
+CHUNKS_PER_WORKER = 2
+
+# each worker process opens its own connection to the result cache, if any
+cache: ResultCache | None = None
+# seconds allowed per number, and a flag the parent sets on Ctrl+C
+timeout: float | None = None
+cancel: c_bool | None = None
 
 
 class PrimeResult(NamedTuple):
     n: int
-    flag: bool
+    # None when the engine gave up
+    flag: bool | None
     elapsed: float
+    cached: bool = False
+
+
+def init_worker(cache_path: str | None, seconds: float | None,
+                flag: c_bool) -> None:
+    global cache, timeout, cancel
+    # Ctrl+C reaches the whole process group; the parent sets ``cancel``
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if cache_path:
+        cache = ResultCache(cache_path)
+    timeout, cancel = seconds, flag
 
 
-def check(n: int):
+def cancelled() -> bool:
+    return cancel is not None and cancel.value
+
+
+def check(n: int, engine: Engine = is_prime, cache: ResultCache | None = None,
+          expired: Expired | None = None):
     t0 = perf_counter()
-    result = is_prime(n)
+    if cache is not None and (result := cache.get(n)) is not None:
+        return PrimeResult(n, result, perf_counter() - t0, True)
+    try:
+        result = engine(n, expired)
+    except Undecided:
+        return PrimeResult(n, None, perf_counter() - t0)
     elapsed = perf_counter() - t0
+    if cache is not None:
+        cache.put(n, result)
     return PrimeResult(n, result, elapsed)
 
 
+def check_chunk(numbers: list[int], engine: Engine = is_prime
+                ) -> tuple[int, float, list[PrimeResult]]:
+    t0 = perf_counter()
+    results = [check(n, engine, cache, deadline(timeout, cancelled))
+               for n in numbers]
+    if cache is not None:
+        cache.flush()
+    return os.getpid(), perf_counter() - t0, results
+
+
+def cancel_on_interrupt(flag: c_bool) -> None:
+    """Make the first Ctrl+C set ``flag``, and a second one interrupt."""
+    def handler(signum, frame):
+        flag.value = True
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+
+    signal.signal(signal.SIGINT, handler)
+
+
+def process_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description='Check NUMBERS for primality with a process pool.')
+    parser.add_argument('workers', nargs='?', type=int,
+                        help='number of worker processes (default: CPU count)')
+    parser.add_argument(
+        '-e', '--engine', choices=ENGINES, default=DEFAULT_ENGINE,
+        help=f'primality test to use (default={DEFAULT_ENGINE})')
+    parser.add_argument(
+        '-c', '--cache', metavar='PATH',
+        help='reuse and store results in the sqlite database at PATH')
+    parser.add_argument(
+        '-t', '--timeout', metavar='SECONDS', type=float,
+        help='give up on a number after SECONDS, reporting it as undecided')
+    return parser.parse_args()
+
+
 def main():
-    if len(sys.argv) < 2:
-        workers = None
-    else:
-        workers = int(sys.argv[1])
+    args = process_args()
 
-    executor = futures.ProcessPoolExecutor(workers)
+    # set on Ctrl+C: workers give up on their current numbers and no more
+    # chunks are submitted
+    flag = RawValue(c_bool, False)
+    cancel_on_interrupt(flag)
+    executor = futures.ProcessPoolExecutor(
+        args.workers, initializer=init_worker,
+        initargs=(args.cache, args.timeout, flag))
     actual_workers = executor._max_workers  # type: ignore
 
-    print(f'Checking {len(NUMBERS)} numbers with {actual_workers} processes:')
+    print(f'Checking {len(NUMBERS)} numbers with {actual_workers} processes '
+          f'and {args.engine}:')
 
     t0 = perf_counter()
-    numbers = sorted(NUMBERS, reverse=True)
+    engine = ENGINES[args.engine]
+    numbers = lpt_order(NUMBERS)
+    sizer = ChunkSizer()
+    utilization = Utilization()
+    pending: set[futures.Future] = set()
+    checked = hits = undecided = 0
     with executor:
-        for n, prime, elapsed in executor.map(check, numbers):
-            label = 'P' if prime else ' '
-            print(f'{n:16} {label} {elapsed:9.6f}s')
+        while True:
+            while len(pending) < actual_workers * CHUNKS_PER_WORKER:
+                if flag.value or not (chunk := sizer.take(numbers)):
+                    break
+                pending.add(executor.submit(check_chunk, chunk, engine))
+            if not pending:
+                break
+            done, pending = futures.wait(
+                pending, return_when=futures.FIRST_COMPLETED)
+            for future in done:
+                pid, busy, results = future.result()
+                sizer.observe([result.n for result in results], busy)
+                utilization.record(pid, len(results), busy)
+                checked += len(results)
+                hits += sum(result.cached for result in results)
+                undecided += sum(result.flag is None for result in results)
+                for n, prime, elapsed, _ in results:
+                    label = '?' if prime is None else 'P' if prime else ' '
+                    print(f'{n:16} {label} {elapsed:9.6f}s')
 
     time = perf_counter() - t0
+    if flag.value:
+        print(f'Cancelled after {checked} of {len(NUMBERS)} checks')
     print(f'total time: {time:.2f}s')
+    if undecided:
+        print(f'{undecided} undecided: time budget exceeded or cancelled')
+    if args.cache:
+        print(f'Cache: {hits} hits, {checked - hits} misses')
+    utilization.report(time, actual_workers)
 
 
 if __name__ == '__main__':
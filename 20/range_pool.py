@@ -0,0 +1,99 @@
+import argparse
+import os
+from array import array
+from collections import deque
+from collections.abc import Iterator
+from concurrent import futures
+from time import perf_counter
+
+from primes import SEGMENT_SIZE, segments, sieve_segment
+from schedule import Utilization
+
+# segments submitted ahead per worker; only these are held in memory
+SEGMENTS_PER_WORKER = 2
+
+
+def sieve_job(lo: int, hi: int) -> tuple[int, float, array]:
+    t0 = perf_counter()
+    found = sieve_segment(lo, hi)
+    return os.getpid(), perf_counter() - t0, found
+
+
+def sieve_range(executor: futures.ProcessPoolExecutor, workers: int,
+                a: int, b: int, size: int = SEGMENT_SIZE
+                ) -> Iterator[tuple[int, int, int, float, array]]:
+    """(lo, hi, pid, busy, primes) of each segment of ``range(a, b)``, in order."""
+    bounds = segments(a, b, size)
+    pending: deque[tuple[int, int, futures.Future]] = deque()
+    try:
+        while True:
+            while len(pending) < workers * SEGMENTS_PER_WORKER:
+                if (segment := next(bounds, None)) is None:
+                    break
+                pending.append((*segment, executor.submit(sieve_job, *segment)))
+            if not pending:
+                return
+            lo, hi, future = pending.popleft()
+            yield lo, hi, *future.result()
+    finally:
+        for *_, future in pending:
+            future.cancel()
+
+
+def primes_in_range(a: int, b: int, workers: int | None = None,
+                    size: int = SEGMENT_SIZE) -> Iterator[int]:
+    """Primes in ``range(a, b)`` in order, sieving segments in parallel."""
+    with futures.ProcessPoolExecutor(workers) as executor:
+        actual_workers = executor._max_workers  # type: ignore
+        for *_, found in sieve_range(executor, actual_workers, a, b, size):
+            yield from found
+
+
+def process_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description='Find the primes in range(START, STOP) with a process pool.')
+    parser.add_argument('start', type=int)
+    parser.add_argument('stop', type=int)
+    parser.add_argument('workers', nargs='?', type=int,
+                        help='number of worker processes (default: CPU count)')
+    parser.add_argument(
+        '-s', '--size', type=int, default=SEGMENT_SIZE,
+        help=f'odd numbers per segment (default={SEGMENT_SIZE})')
+    parser.add_argument('-p', '--print', action='store_true',
+                        help='print the primes instead of per-segment counts')
+    return parser.parse_args()
+
+
+def main():
+    args = process_args()
+
+    executor = futures.ProcessPoolExecutor(args.workers)
+    actual_workers = executor._max_workers  # type: ignore
+
+    if not args.print:
+        print(f'Sieving range({args.start}, {args.stop}) with '
+              f'{actual_workers} processes:')
+
+    t0 = perf_counter()
+    utilization = Utilization()
+    total = 0
+    with executor:
+        results = sieve_range(executor, actual_workers,
+                              args.start, args.stop, args.size)
+        for lo, hi, pid, busy, found in results:
+            utilization.record(pid, hi - lo, busy)
+            total += len(found)
+            if args.print:
+                if found:
+                    print(*found, sep='\n')
+            else:
+                print(f'{lo:20} {hi:20} {len(found):9} {busy:9.3f}s')
+
+    time = perf_counter() - t0
+    if not args.print:
+        print(f'{total} primes, total time: {time:.2f}s')
+        utilization.report(time, actual_workers)
+
+
+if __name__ == '__main__':
+    main()
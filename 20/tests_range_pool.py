@@ -0,0 +1,14 @@
+import primes
+from range_pool import primes_in_range
+
+
+def test_parallel_matches_sequential():
+    a, b = 10 ** 9, 10 ** 9 + 50_000
+    assert list(primes_in_range(a, b, 2, size=999)) == list(primes.primes_in_range(a, b))
+    assert list(primes_in_range(0, 100, 2, size=7)) == primes.small_primes(100)
+
+
+def test_stops_early():
+    found = primes_in_range(0, 10 ** 9, 2, size=1000)
+    assert [next(found) for _ in range(3)] == [2, 3, 5]
+    found.close()
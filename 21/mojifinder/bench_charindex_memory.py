@@ -0,0 +1,60 @@
+"""Heap retained by each InvertedIndex layout, measured with tracemalloc.
+
+Compares the original layout, a defaultdict of sets of single-char
+strings, with the built, loaded and compact loaded InvertedIndex.
+"""
+
+import gc
+import tracemalloc
+import unicodedata
+from collections import defaultdict
+from collections.abc import Callable
+from typing import Any
+
+from charindex import STOP_CODE, InvertedIndex, load_index, tokenize
+
+
+def sets_layout(start: int = 32, stop: int = STOP_CODE) -> defaultdict[str, set[str]]:
+    entries: defaultdict[str, set[str]] = defaultdict(set)
+    for char in (chr(i) for i in range(start, stop)):
+        name = unicodedata.name(char, '')
+        if name:
+            for word in tokenize(name):
+                entries[word].add(char)
+    return entries
+
+
+def retained(build: Callable[[], Any]) -> tuple[Any, int]:
+    gc.collect()
+    tracemalloc.start()
+    obj = build()
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return obj, size
+
+
+def main():
+    load_index()  # make sure the index file is up to date
+    print(f'{"layout":>20} {"heap":>12} {"mapped":>12}')
+    entries, size = retained(sets_layout)
+    print(f'{"defaultdict of sets":>20} {size:12,} {0:12,}')
+    del entries
+    layouts = [
+        ('built', InvertedIndex),
+        ('built compact', lambda: InvertedIndex(compact=True)),
+        ('loaded', InvertedIndex.load),
+        ('loaded compact', lambda: InvertedIndex.load(compact=True)),
+    ]
+    for label, build in layouts:
+        index, size = retained(build)
+        report = index.memory_report()
+        mapped = report['total_bytes'] if report['mapped'] else 0
+        print(f'{label:>20} {size:12,} {mapped:12,}')
+    print(f'{report["terms"]:,} terms, {report["postings"]:,} postings')
+    for structure, size in report['bytes'].items():
+        print(f'{structure:>20} {size:12,}')
+
+
+if __name__ == '__main__':
+    main()
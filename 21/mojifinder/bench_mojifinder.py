@@ -0,0 +1,216 @@
+"""Load test for tcp_mojifinder and web_mojifinder.
+
+Starts each server on a local port, replays QUERIES from many concurrent
+asyncio clients and prints a JSON report to track across releases.
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import subprocess
+import sys
+from pathlib import Path
+from time import perf_counter
+from typing import Any
+from urllib.parse import quote
+
+from charindex import InvertedIndex, load_index
+
+HERE = Path(__file__).parent.absolute()
+HOST = '127.0.0.1'
+SERVERS = ('tcp', 'web')
+PORTS = {'tcp': 2398, 'web': 8098}
+CLIENTS = 50
+DURATION = 10.0
+STARTUP_TIMEOUT = 60.0
+PROMPT = b'?> '
+QUERIES = {
+    'word': ['cat', 'chess', 'heart', 'arrow', 'moon', 'snake'],
+    'multi-word': ['cat face', 'black chess', 'red heart', 'sign dollar',
+                   'latin small letter a', 'greek capital letter omega'],
+    'broad': ['latin', 'sign', 'letter', 'small', 'symbol'],
+    'empty-result': ['zzyzx', 'cat greek dollar', 'qwertyuiop'],
+}
+
+
+def query_mix() -> list[str]:
+    """Queries interleaved by kind, so each client sees the whole mix."""
+    groups = QUERIES.values()
+    mix = itertools.chain.from_iterable(itertools.zip_longest(*groups))
+    return [query for query in mix if query is not None]
+
+
+def server_command(server: str, port: int) -> list[str]:
+    if server == 'tcp':
+        return [sys.executable, 'tcp_mojifinder.py', HOST, str(port)]
+    return [sys.executable, '-m', 'uvicorn', 'web_mojifinder:app',
+            '--host', HOST, '--port', str(port), '--log-level', 'warning']
+
+
+def rss(pid: int) -> int | None:
+    """Resident set size of process ``pid`` in bytes, where /proc exists."""
+    try:
+        with open(f'/proc/{pid}/status') as fp:
+            for line in fp:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+async def wait_for_server(proc: subprocess.Popen, port: int) -> float:
+    t0 = perf_counter()
+    while perf_counter() - t0 < STARTUP_TIMEOUT:
+        if proc.poll() is not None:
+            raise RuntimeError(f'server exited with status {proc.returncode}')
+        try:
+            _, writer = await asyncio.open_connection(HOST, port)
+        except OSError:
+            await asyncio.sleep(.05)
+            continue
+        writer.close()
+        await writer.wait_closed()
+        return perf_counter() - t0
+    raise TimeoutError(f'server not listening after {STARTUP_TIMEOUT}s')
+
+
+async def tcp_client(port: int, queries: list[str], deadline: float,
+                     latencies: list[float]) -> None:
+    reader, writer = await asyncio.open_connection(HOST, port)
+    await reader.readuntil(PROMPT)
+    for query in itertools.cycle(queries):
+        if perf_counter() >= deadline:
+            break
+        t0 = perf_counter()
+        writer.write(query.encode() + b'\r\n')
+        await reader.readuntil(PROMPT)
+        latencies.append(perf_counter() - t0)
+    writer.close()
+    await writer.wait_closed()
+
+
+async def web_client(port: int, queries: list[str], deadline: float,
+                     latencies: list[float]) -> None:
+    reader, writer = await asyncio.open_connection(HOST, port)
+    for query in itertools.cycle(queries):
+        if perf_counter() >= deadline:
+            break
+        t0 = perf_counter()
+        request = f'GET /search?q={quote(query)} HTTP/1.1\r\nHost: {HOST}\r\n\r\n'
+        writer.write(request.encode())
+        head = await reader.readuntil(b'\r\n\r\n')
+        status = int(head.split(None, 2)[1])
+        length = 0
+        for line in head.split(b'\r\n'):
+            name, _, value = line.partition(b':')
+            if name.lower() == b'content-length':
+                length = int(value)
+        await reader.readexactly(length)
+        if status != 200:
+            raise RuntimeError(f'{query!r}: HTTP status {status}')
+        latencies.append(perf_counter() - t0)
+    writer.close()
+    await writer.wait_closed()
+
+
+def percentile(ordered: list[float], q: float) -> float:
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def run_server(server: str, port: int, clients: int,
+                     duration: float) -> dict[str, Any]:
+    proc = subprocess.Popen(server_command(server, port), cwd=HERE,
+                            stdout=subprocess.DEVNULL,
+                            stderr=subprocess.DEVNULL)
+    try:
+        startup = await wait_for_server(proc, port)
+        idle_rss = rss(proc.pid)
+        client = tcp_client if server == 'tcp' else web_client
+        queries = query_mix()
+        latencies: list[float] = []
+        deadline = perf_counter() + duration
+        t0 = perf_counter()
+        # each client starts at a different point of the mix
+        await asyncio.gather(*(
+            client(port, queries[i % len(queries):] + queries[:i % len(queries)],
+                   deadline, latencies)
+            for i in range(clients)))
+        elapsed = perf_counter() - t0
+        latencies.sort()
+        return {
+            'clients': clients,
+            'requests': len(latencies),
+            'seconds': elapsed,
+            'throughput': len(latencies) / elapsed,
+            'p50': percentile(latencies, .50),
+            'p95': percentile(latencies, .95),
+            'p99': percentile(latencies, .99),
+            'max': latencies[-1] if latencies else 0.0,
+            'startup_seconds': startup,
+            'rss_idle': idle_rss,
+            'rss_loaded': rss(proc.pid),
+        }
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def index_timings() -> dict[str, float]:
+    t0 = perf_counter()
+    InvertedIndex()
+    build = perf_counter() - t0
+    t0 = perf_counter()
+    load_index()
+    return {'build_seconds': build, 'load_seconds': perf_counter() - t0}
+
+
+async def run(args: argparse.Namespace) -> dict[str, Any]:
+    report: dict[str, Any] = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'index': index_timings(),
+    }
+    for server in args.servers:
+        try:
+            report[server] = await run_server(
+                server, PORTS[server], args.clients, args.duration)
+        except (OSError, RuntimeError, TimeoutError,
+                asyncio.IncompleteReadError) as exc:
+            report[server] = {'error': f'{type(exc).__name__}: {exc}'}
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark the mojifinder servers; prints a JSON report.')
+    parser.add_argument(
+        'servers', nargs='*', default=list(SERVERS), metavar='SERVER',
+        help=f'servers to test: {", ".join(SERVERS)} (default: all)')
+    parser.add_argument(
+        '-c', '--clients', metavar='N', type=int, default=CLIENTS,
+        help=f'concurrent connections (default={CLIENTS})')
+    parser.add_argument(
+        '-d', '--duration', metavar='SECONDS', type=float, default=DURATION,
+        help=f'time to run each server for (default={DURATION})')
+    parser.add_argument(
+        '-o', '--output', metavar='FILE', type=Path,
+        help='write the report to FILE instead of stdout')
+    args = parser.parse_args()
+    if unknown := set(args.servers) - set(SERVERS):
+        parser.error(f'unknown server(s): {", ".join(sorted(unknown))}')
+    report = json.dumps(asyncio.run(run(args)), indent=2)
+    if args.output:
+        args.output.write_text(report + '\n')
+    else:
+        print(report)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,12 +1,47 @@
+import bisect
+import heapq
+import itertools
+import json
+import mmap
+import os
+import struct
 import sys
-from collections.abc import Iterator
+from array import array
+from concurrent import futures
+from collections.abc import Iterator, Mapping, Sequence
+from pathlib import Path
+from typing import Any, NamedTuple
 
 import unicodedata
 from collections import defaultdict
 
 STOP_CODE = sys.maxunicode + 1
 Char = str
-Index = defaultdict[str, set[Char]]
+Postings = Sequence[int]
+
+INDEX_PATH = Path(__file__).parent.absolute() / 'charindex.idx'
+# magic, format version, unidata_version, term count, postings count,
+# name sizes count, named code point count, JSON fragments size, terms
+# size, followed by term offsets, postings, named code points and fragment offsets (all
+# uint32), name sizes (uint8), the JSON fragments and the UTF-8 terms joined
+# by newlines, in native byte order.
+MAGIC = b'MOJI'
+FORMAT_VERSION = 4
+HEADER = struct.Struct('=4sI16sIIIIII')
+# gallop through the longer postings only when it is this many times longer
+# than the shorter one; otherwise a C-level set intersection is faster.
+GALLOP_RATIO = 32
+# query word suffixes: 'CAR*' matches terms starting with CAR,
+# 'CARD~' matches terms within FUZZY_DISTANCE edits of CARD
+PREFIX_MARK = '*'
+FUZZY_MARK = '~'
+FUZZY_DISTANCE = 1
+# cost() charges fuzzy words as if they scanned this many postings
+FUZZY_COST = 10_000
+MAX_NAME_SIZE = 255
+# the code point range is cut into this many shards per build worker, so
+# workers that draw sparse planes can pick up more shards
+SHARDS_PER_WORKER = 8
 
 
 def tokenize(text: str) -> Iterator[str]:
@@ -14,31 +49,564 @@ def tokenize(text: str) -> Iterator[str]:
         yield word
 
 
+def gallop(postings: Postings, target: int, lo: int = 0) -> int:
+    """Return the first position from ``lo`` where ``postings[pos] >= target``."""
+    size = len(postings)
+    hi = lo
+    step = 1
+    while hi < size and postings[hi] < target:
+        lo = hi + 1
+        hi += step
+        step *= 2
+    return bisect.bisect_left(postings, target, lo, min(hi, size))
+
+
+def intersect(shorter: Postings, longer: Postings) -> array:
+    if len(shorter) > len(longer):
+        shorter, longer = longer, shorter
+    if len(longer) <= GALLOP_RATIO * len(shorter):
+        return array('I', sorted(set(shorter).intersection(longer)))
+    found = array('I')
+    pos = 0
+    size = len(longer)
+    for code in shorter:
+        pos = gallop(longer, code, pos)
+        if pos == size:
+            break
+        if longer[pos] == code:
+            found.append(code)
+            pos += 1
+    return found
+
+
+def union(group: list[Postings]) -> Postings:
+    if len(group) == 1:
+        return group[0]
+    return array('I', sorted(set().union(*group)))
+
+
+def intersect_group(found: Postings, group: list[Postings]) -> Postings:
+    """Codes in ``found`` that appear in any of the ``group`` postings."""
+    if len(group) == 1:
+        return intersect(found, group[0])
+    found_set = set(found)
+    hits: set[int] = set()
+    for postings in group:
+        hits.update(found_set.intersection(postings))
+    return array('I', sorted(hits))
+
+
+def match_groups(groups: list[list[Postings]]) -> Postings:
+    """Codes found in at least one postings list of every group."""
+    groups = sorted(groups, key=lambda group: sum(map(len, group)))
+    found = union(groups[0])
+    for group in groups[1:]:
+        if not found:
+            break
+        found = intersect_group(found, group)
+    return found
+
+
+def prefix_end(prefix: str) -> str:
+    """Smallest string greater than every string starting with ``prefix``."""
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def json_fragment(char: Char, name: str) -> bytes:
+    return json.dumps({'char': char, 'name': name}, ensure_ascii=False).encode()
+
+
+class Shard(NamedTuple):
+    entries: dict[str, array]
+    name_sizes: array
+    named: array
+    fragment_ends: array
+    fragments: bytes
+
+
+def build_shard(start: int, stop: int) -> Shard:
+    """Index data for the code points in ``range(start, stop)``."""
+    entries: dict[str, array] = {}
+    name_sizes = array('B', bytes(stop - start))
+    named = array('I')
+    fragment_ends = array('I')
+    fragments = bytearray()
+    for code in range(start, stop):
+        char = chr(code)
+        name = unicodedata.name(char, '')
+        if name:
+            words = list(tokenize(name))
+            name_sizes[code - start] = min(len(words), MAX_NAME_SIZE)
+            for word in words:
+                postings = entries.setdefault(word, array('I'))
+                if not postings or postings[-1] != code:
+                    postings.append(code)
+            named.append(code)
+            fragments += json_fragment(char, name)
+            fragment_ends.append(len(fragments))
+    return Shard(entries, name_sizes, named, fragment_ends, bytes(fragments))
+
+
+def shard_bounds(start: int, stop: int, count: int) -> list[tuple[int, int]]:
+    step = max(1, -(-(stop - start) // count))
+    return [(lo, min(lo + step, stop)) for lo in range(start, stop, step)]
+
+
+class Page(NamedTuple):
+    total: int
+    chars: Iterator[Char]
+
+
+class PackedTerms(Sequence[str]):
+    """Sorted terms kept as newline-separated UTF-8 ``data``, decoded on access.
+
+    Costs 4 bytes per term on the heap plus ``data``, which may be a view of
+    the mapped index file, instead of a list of ``str`` objects.
+    """
+
+    def __init__(self, data: bytes | memoryview):
+        self._data = data
+        sizes = (len(term) + 1 for term in bytes(data).split(b'\n')) if data else ()
+        self._starts = array('I', itertools.accumulate(sizes, initial=0))
+
+    def __len__(self) -> int:
+        return len(self._starts) - 1
+
+    def __getitem__(self, pos):
+        if isinstance(pos, slice):
+            return [self[i] for i in range(*pos.indices(len(self)))]
+        if pos < 0:
+            pos += len(self)
+        if not 0 <= pos < len(self):
+            raise IndexError('term position out of range')
+        return str(self._data[self._starts[pos]:self._starts[pos + 1] - 1], 'utf-8')
+
+    def nbytes(self) -> int:
+        return nbytes(self._starts) + nbytes(self._data)
+
+
+def nbytes(buffer: Any) -> int:
+    return memoryview(buffer).nbytes
+
+
 class InvertedIndex:
-    entries: Index
-
-    def __init__(self, start: int = 32, stop: int = STOP_CODE):
-        entries: Index = defaultdict(set)
-        for char in (chr(i) for i in range(start, stop)):
-            name = unicodedata.name(char, '')
-            if name:
-                for word in tokenize(name):
-                    entries[word].add(char)
-        self.entries = entries
-
-    def search(self, query: str) -> set[Char]:
-        if words := list(tokenize(query)):
-            found = self.entries[words[0]]
-            return found.intersection(*(self.entries[w] for w in words[1:]))
+    terms: Sequence[str]
+    unidata_version: str
+
+    def __init__(self, start: int = 32, stop: int = STOP_CODE,
+                 workers: int | None = 1, compact: bool = False):
+        if workers == 1:
+            shards = [build_shard(start, stop)]
+        else:
+            executor = futures.ProcessPoolExecutor(workers)
+            actual_workers = executor._max_workers  # type: ignore
+            bounds = shard_bounds(start, stop, actual_workers * SHARDS_PER_WORKER)
+            with executor:
+                shards = list(executor.map(build_shard, *zip(*bounds)))
+        # shards come back in code point order, so appending keeps postings sorted
+        entries: defaultdict[str, array] = defaultdict(lambda: array('I'))
+        name_sizes = array('B', bytes(start))
+        named = array('I')
+        fragment_offsets = array('I', [0])
+        fragments = bytearray()
+        for shard in shards:
+            for word, postings in shard.entries.items():
+                entries[word].extend(postings)
+            name_sizes.extend(shard.name_sizes)
+            named.extend(shard.named)
+            base = len(fragments)
+            fragment_offsets.extend(base + end for end in shard.fragment_ends)
+            fragments += shard.fragments
+        self._assign(entries, name_sizes, named, fragment_offsets,
+                     bytes(fragments), compact)
+
+    @classmethod
+    def from_entries(cls, entries: Mapping[str, Postings],
+                     name_sizes: Postings | None = None,
+                     named: Postings | None = None,
+                     fragment_offsets: Postings | None = None,
+                     fragments: bytes = b'',
+                     compact: bool = False) -> 'InvertedIndex':
+        """Index of ``entries``, mapping terms to sorted code points.
+
+        Without the name tables, ``rank`` and ``json_fragment`` are unusable.
+        """
+        index = cls.__new__(cls)
+        index._assign(entries,
+                      array('B') if name_sizes is None else name_sizes,
+                      array('I') if named is None else named,
+                      array('I', [0]) if fragment_offsets is None else fragment_offsets,
+                      fragments, compact)
+        return index
+
+    def _assign(self, entries: Mapping[str, Postings], name_sizes: Postings,
+                named: Postings, fragment_offsets: Postings, fragments: bytes,
+                compact: bool) -> None:
+        self._name_sizes = name_sizes
+        self._named = named
+        self._fragment_offsets = fragment_offsets
+        self._fragments = fragments
+        terms = sorted(entries)
+        self._offsets = array('I', [0])
+        self._postings = array('I')
+        for term in terms:
+            # postings may be views of a mapped file: copy them as raw bytes
+            self._postings.frombytes(memoryview(entries[term]).cast('B'))
+            self._offsets.append(len(self._postings))
+        if compact:
+            self.terms = PackedTerms('\n'.join(terms).encode())
+        else:
+            self.terms = terms
+        self.unidata_version = unicodedata.unidata_version
+        self._alphabet = None
+        self._mmap = None
+
+    @property
+    def compact(self) -> bool:
+        return isinstance(self.terms, PackedTerms)
+
+    def memory_report(self) -> dict[str, Any]:
+        """Term and postings counts, and the bytes held by each structure.
+
+        Arrays of a loaded index are views of the mapped file, shared by
+        every process that loads it; only ``terms`` lives on the heap.
+        """
+        if isinstance(self.terms, PackedTerms):
+            terms_size = self.terms.nbytes()
+        else:
+            terms_size = (sys.getsizeof(self.terms)
+                          + sum(map(sys.getsizeof, self.terms)))
+        sizes = {
+            'terms': terms_size,
+            'offsets': nbytes(self._offsets),
+            'postings': nbytes(self._postings),
+            'name_sizes': nbytes(self._name_sizes),
+            'named': nbytes(self._named),
+            'fragment_offsets': nbytes(self._fragment_offsets),
+            'fragments': nbytes(self._fragments),
+        }
+        return {
+            'terms': len(self.terms),
+            'postings': len(self._postings),
+            'compact': self.compact,
+            'mapped': self._mmap is not None,
+            'bytes': sizes,
+            'total_bytes': sum(sizes.values()),
+        }
+
+    def position(self, term: str) -> int | None:
+        pos = bisect.bisect_left(self.terms, term)
+        if pos == len(self.terms) or self.terms[pos] != term:
+            return None
+        return pos
+
+    def postings(self, term: str) -> Postings:
+        """Sorted code points of the characters with ``term`` in their name."""
+        if (pos := self.position(term)) is None:
+            return ()
+        return self._postings[self._offsets[pos]:self._offsets[pos + 1]]
+
+    def alphabet(self) -> str:
+        if self._alphabet is None:
+            self._alphabet = ''.join(sorted(set(''.join(self.terms))))
+        return self._alphabet
+
+    def prefix_range(self, prefix: str) -> range:
+        """Positions in ``terms`` of the terms starting with ``prefix``."""
+        if not prefix:
+            return range(len(self.terms))
+        lo = bisect.bisect_left(self.terms, prefix)
+        hi = bisect.bisect_left(self.terms, prefix_end(prefix), lo)
+        return range(lo, hi)
+
+    def fuzzy_terms(self, word: str, max_distance: int) -> Iterator[int]:
+        """Positions in ``terms`` of the terms within ``max_distance`` edits of ``word``.
+
+        For a single edit the candidate spellings are looked up directly.
+        Otherwise the sorted terms are walked like a trie: Levenshtein rows
+        are kept for the prefix shared with the previous term, and every
+        term under a prefix whose row already exceeds ``max_distance`` is
+        skipped.
+        """
+        if max_distance == 1:
+            yield from sorted(self._single_edit_terms(word))
+            return
+        terms = self.terms
+        rows = [list(range(len(word) + 1))]
+        prev = ''
+        pos = 0
+        while pos < len(terms):
+            term = terms[pos]
+            common = 0
+            for a, b in zip(prev, term):
+                if a != b:
+                    break
+                common += 1
+            del rows[common + 1:]
+            for depth in range(common, len(term)):
+                char = term[depth]
+                last = rows[-1]
+                row = [last[0] + 1]
+                for i, wchar in enumerate(word, 1):
+                    row.append(min(row[i - 1] + 1, last[i] + 1,
+                                   last[i - 1] + (wchar != char)))
+                rows.append(row)
+                if min(row) > max_distance:
+                    prev = term[:depth + 1]
+                    pos = bisect.bisect_left(terms, prefix_end(prev), pos)
+                    break
+            else:
+                prev = term
+                if rows[-1][-1] <= max_distance:
+                    yield pos
+                pos += 1
+
+    def _single_edit_terms(self, word: str) -> Iterator[int]:
+        candidates = {word}
+        for i in range(len(word) + 1):
+            head, tail = word[:i], word[i:]
+            if tail:
+                candidates.add(head + tail[1:])
+            for char in self.alphabet():
+                candidates.add(head + char + tail)
+                if tail:
+                    candidates.add(head + char + tail[1:])
+        for candidate in candidates:
+            if (pos := self.position(candidate)) is not None:
+                yield pos
+
+    def expand(self, word: str, prefix: bool = False,
+               max_distance: int = 0) -> list[Postings]:
+        """Postings of every term matched by a single query ``word``."""
+        if word.endswith(PREFIX_MARK):
+            word, prefix = word.rstrip(PREFIX_MARK), True
+        elif word.endswith(FUZZY_MARK):
+            word, max_distance = word.rstrip(FUZZY_MARK), max(max_distance, FUZZY_DISTANCE)
+        if not word:
+            return [()]
+        if not (prefix or max_distance):
+            return [self.postings(word)]
+        positions: set[int] = set()
+        if prefix:
+            positions.update(self.prefix_range(word))
+        if max_distance:
+            positions.update(self.fuzzy_terms(word, max_distance))
+        offsets = self._offsets
+        return [self._postings[offsets[pos]:offsets[pos + 1]]
+                for pos in sorted(positions)] or [()]
+
+    def cost(self, query: str) -> int:
+        """Rough work needed by ``search_codes(query)``: postings it will scan."""
+        total = 0
+        for word in set(tokenize(query)):
+            if word.endswith(FUZZY_MARK):
+                total += FUZZY_COST
+            elif word.endswith(PREFIX_MARK):
+                if word := word.rstrip(PREFIX_MARK):
+                    span = self.prefix_range(word)
+                    total += self._offsets[span.stop] - self._offsets[span.start]
+            else:
+                total += len(self.postings(word))
+        return total
+
+    def search_codes(self, query: str, prefix: bool = False,
+                     max_distance: int = 0) -> Postings:
+        """Sorted code points of the characters matching every word in ``query``."""
+        if words := set(tokenize(query)):
+            return match_groups([self.expand(w, prefix, max_distance)
+                                 for w in words])
         else:
-            return set()
+            return ()
+
+    def search(self, query: str, prefix: bool = False,
+               max_distance: int = 0) -> set[Char]:
+        return set(map(chr, self.search_codes(query, prefix, max_distance)))
+
+    def rank(self, code: int) -> tuple[int, int]:
+        """Sort key putting characters with shorter names first."""
+        return self._name_sizes[code], code
+
+    def ranked_codes(self, query: str, offset: int = 0, limit: int | None = None,
+                     prefix: bool = False,
+                     max_distance: int = 0) -> tuple[int, Iterator[int]]:
+        codes = self.search_codes(query, prefix, max_distance)
+        if limit is None:
+            ranked = sorted(codes, key=self.rank)
+        else:
+            ranked = heapq.nsmallest(offset + limit, codes, key=self.rank)
+        return len(codes), itertools.islice(ranked, offset, None)
+
+    def search_page(self, query: str, offset: int = 0, limit: int | None = None,
+                    prefix: bool = False, max_distance: int = 0) -> Page:
+        """Ranked slice of the results; only that slice is turned into chars."""
+        total, codes = self.ranked_codes(query, offset, limit, prefix, max_distance)
+        return Page(total, map(chr, codes))
+
+    def has_name(self, code: int) -> bool:
+        """Whether ``code`` is indexed under a name."""
+        pos = bisect.bisect_left(self._named, code)
+        return pos < len(self._named) and self._named[pos] == code
+
+    def json_fragment(self, code: int) -> bytes | memoryview:
+        """Pre-encoded ``{"char": ..., "name": ...}`` object for ``code``."""
+        pos = bisect.bisect_left(self._named, code)
+        offsets = self._fragment_offsets
+        return self._fragments[offsets[pos]:offsets[pos + 1]]
+
+    def json_page(self, query: str, offset: int = 0, limit: int | None = None,
+                  prefix: bool = False, max_distance: int = 0) -> tuple[int, bytes]:
+        """Like ``search_page``, encoded as a JSON array of char/name objects."""
+        total, codes = self.ranked_codes(query, offset, limit, prefix, max_distance)
+        return total, b'[' + b','.join(map(self.json_fragment, codes)) + b']'
+
+    def merged(self, delta: 'InvertedIndex', removed: frozenset[int],
+               names: Mapping[int, str]) -> 'InvertedIndex':
+        """New index with the postings of ``delta`` added and every code in
+        ``removed`` dropped; ``names`` holds the names of the added codes
+        that have none in this index, or were removed from it."""
+        added = {term: delta.postings(term) for term in delta.terms}
+        offsets = self._offsets
+        entries: dict[str, Postings] = {}
+        for pos, term in enumerate(self.terms):
+            postings = self._postings[offsets[pos]:offsets[pos + 1]]
+            if removed and not removed.isdisjoint(postings):
+                postings = array('I', (code for code in postings
+                                       if code not in removed))
+            if (more := added.pop(term, None)) is not None:
+                postings = array('I', sorted(set(postings).union(more)))
+            if postings:
+                entries[term] = postings
+        entries.update(added)
+
+        name_sizes = array('B', bytes(self._name_sizes))
+        for code in removed:
+            name_sizes[code] = 0
+        if names and (missing := max(names) + 1 - len(name_sizes)) > 0:
+            # an index built over part of the code space may get codes above it
+            name_sizes.frombytes(bytes(missing))
+        for code, name in names.items():
+            name_sizes[code] = min(len(list(tokenize(name))), MAX_NAME_SIZE)
+
+        # copy the runs of unchanged fragments between changed code points
+        old_named = memoryview(self._named)
+        old_offsets = self._fragment_offsets
+        named = array('I')
+        fragment_offsets = array('I', [0])
+        fragments = bytearray()
+
+        def copy_run(start: int, stop: int) -> None:
+            named.frombytes(old_named[start:stop].cast('B'))
+            shift = len(fragments) - old_offsets[start]
+            fragment_offsets.extend(end + shift
+                                    for end in old_offsets[start + 1:stop + 1])
+            fragments.extend(self._fragments[old_offsets[start]:old_offsets[stop]])
+
+        start = 0
+        for code in sorted(removed | names.keys()):
+            stop = bisect.bisect_left(old_named, code, start)
+            copy_run(start, stop)
+            start = stop + (stop < len(old_named) and old_named[stop] == code)
+            if code in names:
+                named.append(code)
+                fragments += json_fragment(chr(code), names[code])
+                fragment_offsets.append(len(fragments))
+        copy_run(start, len(old_named))
+        return InvertedIndex.from_entries(entries, name_sizes, named,
+                                          fragment_offsets, bytes(fragments),
+                                          self.compact)
+
+    def save(self, path: Path = INDEX_PATH) -> None:
+        terms = '\n'.join(self.terms).encode()
+        header = HEADER.pack(MAGIC, FORMAT_VERSION,
+                             self.unidata_version.encode('ascii'),
+                             len(self.terms), len(self._postings),
+                             len(self._name_sizes), len(self._named),
+                             len(self._fragments), len(terms))
+        tmp_path = path.with_name(f'{path.name}.{os.getpid()}.tmp')
+        with open(tmp_path, 'wb') as fp:
+            fp.write(header)
+            fp.write(bytes(self._offsets))
+            fp.write(bytes(self._postings))
+            fp.write(bytes(self._named))
+            fp.write(bytes(self._fragment_offsets))
+            fp.write(bytes(self._name_sizes))
+            fp.write(self._fragments)
+            fp.write(terms)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: Path = INDEX_PATH, compact: bool = False) -> 'InvertedIndex':
+        with open(path, 'rb') as fp:
+            mm = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            (magic, version, unidata_version, term_count, postings_count,
+             sizes_count, named_count, fragments_size,
+             terms_size) = HEADER.unpack_from(mm)
+        except struct.error:
+            magic = version = None
+        if magic != MAGIC or version != FORMAT_VERSION:
+            mm.close()
+            raise ValueError(f'{path} is not a charindex v{FORMAT_VERSION} file')
+        expected = (HEADER.size + 4 * (term_count + 1 + postings_count)
+                    + 4 * (2 * named_count + 1) + sizes_count
+                    + fragments_size + terms_size)
+        if len(mm) != expected:
+            mm.close()
+            raise ValueError(f'{path} has {len(mm)} bytes, '
+                             f'its header says {expected}')
+        memv = memoryview(mm)
+        start = HEADER.size
+        end = start + 4 * (term_count + 1)
+        offsets = memv[start:end].cast('I')
+        start, end = end, end + 4 * postings_count
+        postings = memv[start:end].cast('I')
+        start, end = end, end + 4 * named_count
+        named = memv[start:end].cast('I')
+        start, end = end, end + 4 * (named_count + 1)
+        fragment_offsets = memv[start:end].cast('I')
+        start, end = end, end + sizes_count
+        name_sizes = memv[start:end]
+        start, end = end, end + fragments_size
+        fragments = memv[start:end]
+        index = cls.__new__(cls)
+        if compact:
+            index.terms = PackedTerms(memv[end:])
+        else:
+            index.terms = str(memv[end:], 'utf-8').split('\n') if term_count else []
+        index._offsets = offsets
+        index._postings = postings
+        index._name_sizes = name_sizes
+        index._named = named
+        index._fragment_offsets = fragment_offsets
+        index._fragments = fragments
+        index.unidata_version = unidata_version.rstrip(b'\0').decode('ascii')
+        index._alphabet = None
+        index._mmap = mm
+        return index
+
+
+def load_index(path: Path = INDEX_PATH, workers: int | None = None,
+               compact: bool = False) -> InvertedIndex:
+    """Load the index saved at ``path``, rebuilding it for a new Unicode version."""
+    try:
+        index = InvertedIndex.load(path, compact)
+    except (OSError, ValueError):
+        pass
+    else:
+        if index.unidata_version == unicodedata.unidata_version:
+            return index
+    index = InvertedIndex(workers=workers, compact=compact)
+    try:
+        index.save(path)
+    except OSError as exc:
+        print(f'Could not save index to {path}: {exc}', file=sys.stderr)
+    return index
 
 
 if __name__ == '__main__':
     # idx = InvertedIndex(32, 128)
-    idx = InvertedIndex(32, )
-    # print(idx.entries['DOLLAR'])
-    # print(sorted(idx.entries['SIGN']))
-    # print(idx.entries['A'] & idx.entries['SMALL'])
+    idx = load_index()
+    # print(idx.postings('DOLLAR'))
+    # print(sorted(idx.postings('SIGN')))
     # print(idx.search('capital a'))
-    print(idx.search('car'))
+    print(idx.search('car', prefix=True))
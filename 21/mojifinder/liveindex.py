@@ -0,0 +1,223 @@
+"""InvertedIndex that accepts added and removed characters at runtime.
+
+Updates go to a small delta segment and a set of tombstones that searches
+consult along with the base index. Once MERGE_THRESHOLD characters have
+changed, both are merged into a new base index, LSM-style. Every update
+publishes a new immutable Snapshot, so searches running in other threads
+never take a lock and never see a half-applied change.
+"""
+
+import heapq
+import itertools
+import threading
+from array import array
+from collections import defaultdict
+from typing import Any, NamedTuple
+
+from charindex import (MAX_NAME_SIZE, Char, InvertedIndex, Page, Postings,
+                       json_fragment, match_groups, tokenize)
+from metrics import log
+
+MERGE_THRESHOLD = 256
+
+
+class Snapshot(NamedTuple):
+    base: InvertedIndex
+    # postings of the characters added since the last merge
+    delta: InvertedIndex | None
+    # base code points whose base postings no longer count
+    removed: frozenset[int]
+    # names of added code points that have none in ``base`` (or were removed)
+    names: dict[int, str]
+    sizes: dict[int, int]
+
+    def search_codes(self, query: str, prefix: bool = False,
+                     max_distance: int = 0) -> Postings:
+        base, delta, removed = self.base, self.delta, self.removed
+        if delta is None and not removed:
+            return base.search_codes(query, prefix, max_distance)
+        if not (words := set(tokenize(query))):
+            return ()
+        groups = []
+        for word in words:
+            group = base.expand(word, prefix, max_distance)
+            if delta is not None:
+                group = group + delta.expand(word, prefix, max_distance)
+            groups.append(group)
+        found = match_groups(groups)
+        if removed:
+            # a removed code matches only through the names added since
+            found = [code for code in found if code not in removed]
+            if delta is not None:
+                readded = delta.search_codes(query, prefix, max_distance)
+                found.extend(code for code in readded if code in removed)
+                found.sort()
+            found = array('I', found)
+        return found
+
+    def rank(self, code: int) -> tuple[int, int]:
+        if (size := self.sizes.get(code)) is not None:
+            return size, code
+        return self.base.rank(code)
+
+    def ranked_codes(self, query: str, offset: int = 0, limit: int | None = None,
+                     prefix: bool = False,
+                     max_distance: int = 0) -> tuple[int, itertools.islice]:
+        codes = self.search_codes(query, prefix, max_distance)
+        if limit is None:
+            ranked = sorted(codes, key=self.rank)
+        else:
+            ranked = heapq.nsmallest(offset + limit, codes, key=self.rank)
+        return len(codes), itertools.islice(ranked, offset, None)
+
+    def json_fragment(self, code: int) -> bytes | memoryview:
+        if (name := self.names.get(code)) is not None:
+            return json_fragment(chr(code), name)
+        return self.base.json_fragment(code)
+
+
+class LiveIndex:
+    """Search API of InvertedIndex, plus ``add``, ``remove`` and ``merge``."""
+
+    def __init__(self, base: InvertedIndex,
+                 merge_threshold: int = MERGE_THRESHOLD):
+        self.merge_threshold = merge_threshold
+        self.merges = 0
+        self.merge_failures = 0
+        # pending count that triggers the next automatic merge
+        self._merge_at = merge_threshold
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._added: dict[int, list[str]] = {}
+        self._removed: set[int] = set()
+        self._snapshot = Snapshot(base, None, frozenset(), {}, {})
+
+    @property
+    def base(self) -> InvertedIndex:
+        return self._snapshot.base
+
+    @property
+    def compact(self) -> bool:
+        return self.base.compact
+
+    @property
+    def unidata_version(self) -> str:
+        return self.base.unidata_version
+
+    def pending(self) -> int:
+        """Characters added or removed since the last merge."""
+        return self._pending
+
+    def add(self, char: Char, name: str) -> None:
+        """Index ``char`` under the words of ``name``, besides any it has."""
+        if len(char) != 1:
+            raise ValueError(f'expected a single character, got {char!r}')
+        if not any(tokenize(name)):
+            raise ValueError('name must have at least one word')
+        with self._lock:
+            self._added.setdefault(ord(char), []).append(name)
+            self._publish()
+
+    def remove(self, char: Char) -> None:
+        """Drop ``char`` and all its names from the index."""
+        if len(char) != 1:
+            raise KeyError(char)
+        code = ord(char)
+        with self._lock:
+            in_base = self.base.has_name(code)
+            if code not in self._added and (not in_base or code in self._removed):
+                raise KeyError(char)
+            self._added.pop(code, None)
+            if in_base:
+                self._removed.add(code)
+            self._publish()
+
+    def _publish(self) -> None:
+        base = self.base
+        entries: defaultdict[str, set[int]] = defaultdict(set)
+        names = {}
+        for code, added in self._added.items():
+            for name in added:
+                for word in tokenize(name):
+                    entries[word].add(code)
+            if code in self._removed or not base.has_name(code):
+                names[code] = added[0]
+        delta = None
+        if entries:
+            delta = InvertedIndex.from_entries(
+                {word: array('I', sorted(codes)) for word, codes in entries.items()})
+        sizes = {code: min(len(list(tokenize(name))), MAX_NAME_SIZE)
+                 for code, name in names.items()}
+        self._snapshot = Snapshot(base, delta, frozenset(self._removed),
+                                  names, sizes)
+        self._pending = len(self._added.keys() | self._removed)
+        if self._pending >= self._merge_at:
+            # the update is already published: a failed merge must not
+            # fail it, and is retried only after merge_threshold more
+            try:
+                self._merge()
+            except Exception:
+                self.merge_failures += 1
+                self._merge_at = self._pending + self.merge_threshold
+                log.exception('LiveIndex merge of %d pending changes failed',
+                              self._pending)
+
+    def merge(self) -> None:
+        """Fold the delta segment and tombstones into a new base index."""
+        with self._lock:
+            self._merge()
+
+    def _merge(self) -> None:
+        snapshot = self._snapshot
+        if snapshot.delta is None and not snapshot.removed:
+            return
+        delta = snapshot.delta or InvertedIndex.from_entries({})
+        base = snapshot.base.merged(delta, snapshot.removed, snapshot.names)
+        self._added.clear()
+        self._removed.clear()
+        self._pending = 0
+        self._merge_at = self.merge_threshold
+        self._snapshot = Snapshot(base, None, frozenset(), {}, {})
+        self.merges += 1
+
+    def save(self, *args: Any) -> None:
+        self.merge()
+        self.base.save(*args)
+
+    def cost(self, query: str) -> int:
+        snapshot = self._snapshot
+        total = snapshot.base.cost(query)
+        if snapshot.delta is not None:
+            total += snapshot.delta.cost(query)
+        return total
+
+    def search_codes(self, query: str, prefix: bool = False,
+                     max_distance: int = 0) -> Postings:
+        return self._snapshot.search_codes(query, prefix, max_distance)
+
+    def search(self, query: str, prefix: bool = False,
+               max_distance: int = 0) -> set[Char]:
+        return set(map(chr, self.search_codes(query, prefix, max_distance)))
+
+    def search_page(self, query: str, offset: int = 0, limit: int | None = None,
+                    prefix: bool = False, max_distance: int = 0) -> Page:
+        total, codes = self._snapshot.ranked_codes(
+            query, offset, limit, prefix, max_distance)
+        return Page(total, map(chr, codes))
+
+    def json_page(self, query: str, offset: int = 0, limit: int | None = None,
+                  prefix: bool = False, max_distance: int = 0) -> tuple[int, bytes]:
+        snapshot = self._snapshot
+        total, codes = snapshot.ranked_codes(
+            query, offset, limit, prefix, max_distance)
+        return total, b'[' + b','.join(map(snapshot.json_fragment, codes)) + b']'
+
+    def memory_report(self) -> dict[str, Any]:
+        snapshot = self._snapshot
+        report = snapshot.base.memory_report()
+        report['pending'] = self.pending()
+        report['merges'] = self.merges
+        report['merge_failures'] = self.merge_failures
+        if snapshot.delta is not None:
+            report['delta'] = snapshot.delta.memory_report()['bytes']
+        return report
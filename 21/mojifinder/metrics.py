@@ -0,0 +1,126 @@
+import bisect
+import logging
+import logging.handlers
+import queue
+import random
+from time import perf_counter
+from typing import Any
+
+# upper bounds in seconds, as in a Prometheus histogram
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+                   0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+# fraction of queries written to the query log
+LOG_SAMPLE_RATE = 0.01
+
+log = logging.getLogger('mojifinder')
+
+
+class Histogram:
+    def __init__(self, bounds: tuple[float, ...] = LATENCY_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the ``q`` quantile."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+    def snapshot(self) -> dict[str, Any]:
+        return {
+            'count': self.count,
+            'sum': self.total,
+            'p50': self.quantile(.5),
+            'p95': self.quantile(.95),
+            'p99': self.quantile(.99),
+        }
+
+    def prometheus(self, name: str) -> list[str]:
+        lines = [f'# TYPE {name} histogram']
+        cumulative = 0
+        for bound, count in zip(self.bounds, self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{le="+Inf"}} {self.count}')
+        lines.append(f'{name}_sum {self.total}')
+        lines.append(f'{name}_count {self.count}')
+        return lines
+
+
+class Metrics:
+    """Counters and latency histograms for one server process.
+
+    Only the event loop thread updates them, so no locking is needed.
+    """
+
+    def __init__(self, sample_rate: float = LOG_SAMPLE_RATE):
+        self.started = perf_counter()
+        self.sample_rate = sample_rate
+        self.connections = 0
+        self.active = 0
+        self.queries = 0
+        self.bytes_sent = 0
+        self.search_latency = Histogram()
+        self.drain_latency = Histogram()
+
+    def sample(self) -> bool:
+        return random.random() < self.sample_rate
+
+    def snapshot(self) -> dict[str, Any]:
+        uptime = perf_counter() - self.started
+        return {
+            'uptime': uptime,
+            'connections': self.connections,
+            'active': self.active,
+            'queries': self.queries,
+            'qps': self.queries / uptime if uptime else 0.0,
+            'bytes_sent': self.bytes_sent,
+            'search_latency': self.search_latency.snapshot(),
+            'drain_latency': self.drain_latency.snapshot(),
+        }
+
+    def prometheus(self, extra: dict[str, float] | None = None) -> str:
+        lines = [
+            '# TYPE mojifinder_connections_total counter',
+            f'mojifinder_connections_total {self.connections}',
+            '# TYPE mojifinder_active_connections gauge',
+            f'mojifinder_active_connections {self.active}',
+            '# TYPE mojifinder_queries_total counter',
+            f'mojifinder_queries_total {self.queries}',
+            '# TYPE mojifinder_bytes_sent_total counter',
+            f'mojifinder_bytes_sent_total {self.bytes_sent}',
+        ]
+        for name, value in (extra or {}).items():
+            lines.append(f'mojifinder_{name} {value}')
+        lines.extend(self.search_latency.prometheus(
+            'mojifinder_search_seconds'))
+        lines.extend(self.drain_latency.prometheus(
+            'mojifinder_drain_seconds'))
+        return '\n'.join(lines) + '\n'
+
+
+def start_logging(level: int = logging.INFO) -> logging.handlers.QueueListener:
+    """Send ``log`` records through a queue to a thread that writes them,
+    so a slow stdout never blocks the event loop."""
+    records: queue.SimpleQueue = queue.SimpleQueue()
+    log.addHandler(logging.handlers.QueueHandler(records))
+    log.setLevel(level)
+    log.propagate = False
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter('%(asctime)s %(process)d %(message)s'))
+    listener = logging.handlers.QueueListener(records, handler)
+    listener.start()
+    return listener
@@ -0,0 +1,63 @@
+from collections import OrderedDict
+from typing import Generic, Hashable, TypeVar
+
+from charindex import tokenize
+
+CACHE_SIZE = 1024
+V = TypeVar('V')
+
+
+def query_key(query: str, *extra: Hashable) -> tuple:
+    """Cache key that ignores case, word order and repeated words."""
+    return (tuple(sorted(set(tokenize(query)))), *extra)
+
+
+class ResponseCache(Generic[V]):
+    """Bounded LRU mapping of query keys to serialized responses.
+
+    ``get`` and ``put`` never await, so handlers running on the same event
+    loop cannot interleave inside them.
+    """
+
+    def __init__(self, maxsize: int = CACHE_SIZE):
+        self.maxsize = maxsize
+        self._entries: OrderedDict[Hashable, V] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> V | None:
+        try:
+            value = self._entries[key]
+        except KeyError:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key: Hashable, value: V) -> None:
+        if self.maxsize <= 0:
+            return
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> dict[str, int | float]:
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
@@ -1,75 +1,424 @@
-import sys
+import argparse
 import asyncio
 from asyncio.trsock import TransportSocket
+from concurrent import futures
 import functools
+import logging
+import os
+import signal
+from multiprocessing import Process, SimpleQueue
+from pathlib import Path
+from time import perf_counter
 from typing import cast, Any, Callable
 
-from charindex import InvertedIndex
+from charindex import INDEX_PATH, InvertedIndex, load_index
+from liveindex import LiveIndex
+from metrics import Metrics, log, start_logging
+from responsecache import ResponseCache, query_key
 
 CRLF = b'\r\n'
 PROMPT = b'?> '
+PAGE_SIZE = 100
+# Queries that arrive together are answered together: each read of up to
+# READ_SIZE bytes is one batch, flushed with a single write and drain, or
+# earlier when the pending output reaches FLUSH_SIZE. The transport pauses
+# the handler once WRITE_BUFFER_HIGH bytes are queued for a slow client.
+READ_SIZE = 64 * 1024
+MAX_LINE = 4 * 1024
+FLUSH_SIZE = 256 * 1024
+WRITE_BUFFER_HIGH = 1024 * 1024
+# Searches whose InvertedIndex.cost() reaches OFFLOAD_COST run in a thread
+# or process pool instead of on the event loop. Clients wait at most
+# SEARCH_TIMEOUT seconds for them, but a search that timed out keeps its
+# pool worker until it ends; while every worker is taken, new expensive
+# searches are answered with a busy line instead of queuing behind them.
+MODES = ('inline', 'thread', 'process')
+OFFLOAD_COST = 20_000
+SEARCH_TIMEOUT = 2.0
+# seconds open connections get to finish after the listener is closed
+GRACE_PERIOD = 1.0
+# in-protocol commands answered with this process's metrics
+STATS = 'STATS'
+STATS_PROMETHEUS = 'STATS PROMETHEUS'
+# 'ADD <char> <name>' indexes char under name, 'REMOVE <char>' drops it;
+# only a single server process that searches in-process accepts them
+ADD = 'ADD'
+REMOVE = 'REMOVE'
 
+Response = tuple[int, bytes]
 
-async def finder(index: InvertedIndex,
+_worker_index: InvertedIndex | None = None
+
+
+def render(query: str, index: InvertedIndex | LiveIndex) -> Response:
+    total, chars = index.search_page(query, limit=PAGE_SIZE)
+    lines = [char.encode() + CRLF for char in chars]
+    status_line = f'{"-" * 66} {total} found'
+    if len(lines) < total:
+        status_line += f', first {len(lines)} shown'
+    lines.append(status_line.encode() + CRLF)
+    return total, b''.join(lines)
+
+
+def init_worker(index_path: Path, compact: bool = False) -> None:
+    global _worker_index
+    _worker_index = load_index(index_path, compact=compact)
+
+
+def render_in_worker(query: str) -> Response:
+    return render(query, cast(InvertedIndex, _worker_index))
+
+
+class Searcher:
+    def __init__(self, index: InvertedIndex | LiveIndex,
+                 cache: ResponseCache[Response],
+                 mode: str = 'thread',
+                 offload_cost: int = OFFLOAD_COST,
+                 timeout: float = SEARCH_TIMEOUT,
+                 workers: int | None = None,
+                 index_path: Path = INDEX_PATH):
+        self.index = index
+        self.cache = cache
+        self.offload_cost = offload_cost
+        self.timeout = timeout
+        self.executor: futures.Executor | None
+        # offloaded searches not finished yet, including abandoned ones
+        self.offloaded = 0
+        self.rejected = 0
+        if mode == 'thread':
+            self.executor = futures.ThreadPoolExecutor(workers)
+        elif mode == 'process':
+            # workers mmap the same index file, so its pages are shared
+            self.executor = futures.ProcessPoolExecutor(
+                workers, initializer=init_worker, initargs=(index_path, index.compact))
+            # start the workers now, before the server opens any socket:
+            # forked on the first offloaded search, they would inherit every
+            # client connection and keep it open after the server closes it
+            self.executor.submit(os.getpid).result()
+        elif mode == 'inline':
+            self.executor = None
+        else:
+            raise ValueError(f'mode must be one of {MODES}, not {mode!r}')
+        self.mode = mode
+        self.max_offloaded = getattr(self.executor, '_max_workers', 0)
+        self.metrics = Metrics()
+        # bumped by every update, so searches started before one are not cached
+        self.generation = 0
+
+    async def search(self, query: str) -> Response:
+        key = query_key(query)
+        if (response := self.cache.get(key)) is not None:
+            return response
+        generation = self.generation
+        if self.executor is None or self.index.cost(query) < self.offload_cost:
+            response = render(query, self.index)
+        elif self.offloaded >= self.max_offloaded:
+            self.rejected += 1
+            return 0, f'{"-" * 66} server busy, try again later'.encode() + CRLF
+        else:
+            loop = asyncio.get_running_loop()
+            if self.mode == 'process':
+                job = loop.run_in_executor(self.executor, render_in_worker, query)
+            else:
+                job = loop.run_in_executor(self.executor, render, query, self.index)
+            self.offloaded += 1
+            job.add_done_callback(self._offload_done)
+            try:
+                # shielded, so a timeout leaves ``job`` running and counted
+                response = await asyncio.wait_for(asyncio.shield(job), self.timeout)
+            except asyncio.TimeoutError:
+                status_line = f'{"-" * 66} search timed out after {self.timeout}s'
+                return 0, status_line.encode() + CRLF
+        if generation == self.generation:
+            self.cache.put(key, response)
+        return response
+
+    def _offload_done(self, job: asyncio.Future) -> None:
+        self.offloaded -= 1
+        if not job.cancelled():
+            job.exception()  # nobody awaits a job that timed out
+
+    async def update(self, line: str) -> bytes:
+        command, *args = line.split(maxsplit=2)
+        command = command.upper()
+        if not isinstance(self.index, LiveIndex):
+            message = f'{command} needs one server process and no process pool'
+        else:
+            try:
+                if command == ADD:
+                    char, name = args
+                    await asyncio.to_thread(self.index.add, char, name)
+                    message = f'added U+{ord(char):04X}'
+                else:
+                    char, = args
+                    await asyncio.to_thread(self.index.remove, char)
+                    message = f'removed U+{ord(char):04X}'
+            except ValueError:
+                message = f'usage: {ADD} <char> <name> | {REMOVE} <char>'
+            except KeyError:
+                message = f'{char!r} is not indexed'
+            else:
+                self.generation += 1
+                self.cache.clear()
+        return f'{"-" * 66} {message}'.encode() + CRLF
+
+    def shutdown(self) -> None:
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> dict[str, Any]:
+        return {**self.metrics.snapshot(), 'cache': self.cache.stats(),
+                'offloaded': self.offloaded, 'rejected': self.rejected}
+
+    def stats_report(self, command: str) -> bytes:
+        if command == STATS_PROMETHEUS:
+            extra = {f'cache_{key}': value
+                     for key, value in self.cache.stats().items()}
+            extra['offloaded_searches'] = self.offloaded
+            extra['rejected_searches_total'] = self.rejected
+            text = self.metrics.prometheus(extra)
+        else:
+            text = ''.join(f'{key} {value}\n'
+                           for key, value in flatten(self.stats()))
+        return text.replace('\n', '\r\n').encode()
+
+
+def flatten(stats: dict[str, Any], prefix: str = '') -> list[tuple[str, Any]]:
+    items = []
+    for key, value in stats.items():
+        if isinstance(value, dict):
+            items.extend(flatten(value, f'{prefix}{key}.'))
+        else:
+            items.append((f'{prefix}{key}', value))
+    return items
+
+
+# open connections and the tasks serving them, for a graceful shutdown
+Clients = dict[asyncio.StreamWriter, asyncio.Task]
+
+
+async def finder(searcher: Searcher,
+                 clients: Clients,
                  reader: asyncio.StreamReader,
                  writer: asyncio.StreamWriter) -> None:
     client = writer.get_extra_info('peername')
-    while True:
-        writer.write(PROMPT)
-        await writer.drain()
-        data = await reader.readline()
-        if not data:
+    metrics = searcher.metrics
+    metrics.connections += 1
+    metrics.active += 1
+    clients[writer] = cast(asyncio.Task, asyncio.current_task())
+    log.debug('Open %s.', client)
+    try:
+        await serve_client(searcher, reader, writer, client)
+    finally:
+        metrics.active -= 1
+        del clients[writer]
+    log.debug('Close %s.', client)
+
+
+async def serve_client(searcher: Searcher,
+                       reader: asyncio.StreamReader,
+                       writer: asyncio.StreamWriter,
+                       client: Any) -> None:
+    metrics = searcher.metrics
+    writer.transport.set_write_buffer_limits(high=WRITE_BUFFER_HIGH)
+    writer.write(PROMPT)
+    pending = b''
+    done = False
+    while not done:
+        data = await reader.read(READ_SIZE)
+        if data:
+            *lines, pending = (pending + data).split(b'\n')
+        elif pending:
+            # EOF ends the last query when it has no trailing newline
+            lines, pending, done = [pending], b'', True
+        else:
             break
-        try:
-            query = data.decode().strip()
-        except UnicodeDecodeError:
-            query = '\x00'
+        if len(pending) > MAX_LINE:
+            break
+        output = bytearray()
+        for line in lines:
+            try:
+                query = line.decode().strip()
+            except UnicodeDecodeError:
+                query = '\x00'
 
-        print(f' From {client}: {query!r}')
-        if query:
-            if ord(query[:1]) < 32:
-                break
-            results = await search(query, index, writer)
-            print(f'   To {client}: {results} results')
+            if query:
+                if ord(query[:1]) < 32:
+                    done = True
+                    break
+                if (command := query.upper()) in (STATS, STATS_PROMETHEUS):
+                    output += searcher.stats_report(command)
+                elif command.split(maxsplit=1)[0] in (ADD, REMOVE):
+                    output += await searcher.update(query)
+                else:
+                    metrics.queries += 1
+                    t0 = perf_counter()
+                    results, payload = await searcher.search(query)
+                    metrics.search_latency.observe(perf_counter() - t0)
+                    output += payload
+                    if metrics.sample():
+                        log.info('%s: %r -> %d results', client, query, results)
+            output += PROMPT
+            if len(output) >= FLUSH_SIZE:
+                await flush(writer, output, metrics)
+                output = bytearray()
+        await flush(writer, output, metrics)
 
     writer.close()
     await writer.wait_closed()
-    print(f'Close {client}.')
 
 
-async def search(query: str,
-                 index: InvertedIndex,
-                 writer: asyncio.StreamWriter) -> int:
-    chars = index.search(query)
-    lines = (line.encode() + CRLF for line in chars)
-    writer.writelines(lines)
+async def flush(writer: asyncio.StreamWriter, output: bytearray,
+                metrics: Metrics) -> None:
+    writer.write(output)
+    metrics.bytes_sent += len(output)
+    t0 = perf_counter()
     await writer.drain()
-    status_line = f'{"-" * 66} {len(chars)} found'
-    writer.write(status_line.encode() + CRLF)
-    await writer.drain()
-    return len(chars)
+    metrics.drain_latency.observe(perf_counter() - t0)
 
 
-async def supervisor(index: InvertedIndex, host: str, port: int):
+async def supervisor(searcher: Searcher, host: str, port: int,
+                     reuse_port: bool = False):
+    clients: Clients = {}
     server = await asyncio.start_server(cast(
-        functools.partial(finder, index), Callable),
-        host, port)
+        Callable, functools.partial(finder, searcher, clients)),
+        host, port, reuse_port=reuse_port)
 
     socket_list = cast(tuple[TransportSocket, ...], server.sockets)
     addr = socket_list[0].getsockname()
-    print(f'Serving on {addr}. Hit Ctrl+C to stop.')
-    await server.serve_forever()
+    print(f'Serving on {addr} (pid {os.getpid()}). Hit Ctrl+C to stop.')
+
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stop.set)
+    await stop.wait()
+
+    server.close()
+    deadline = loop.time() + GRACE_PERIOD
+    while clients and loop.time() < deadline:
+        await asyncio.sleep(.05)
+    # Close idle connections ourselves and let their handlers end: left to
+    # asyncio.run they would be cancelled, and since Python 3.12.1
+    # wait_closed() does not return while any connection is open.
+    tasks = list(clients.values())
+    for writer in list(clients):
+        writer.close()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    await server.wait_closed()
 
 
-def main(host: str = '127.0.0.1', port_arg: str = '2323'):
-    port = int(port_arg)
-    print('Build index...')
-    index = InvertedIndex()
+def serve(args: argparse.Namespace, index: InvertedIndex,
+          reuse_port: bool = False) -> dict[str, Any]:
+    cache: ResponseCache[Response] = ResponseCache()
+    if not reuse_port and args.mode != 'process':
+        # updates would only reach this process, not its siblings or pool
+        index = LiveIndex(index)
+    searcher = Searcher(index, cache, args.mode, args.offload_cost,
+                        args.timeout, args.pool_size)
     try:
-        asyncio.run(supervisor(index, host, port))
-    except KeyboardInterrupt:
-        print('\nServer shut down.')
+        asyncio.run(supervisor(searcher, args.host, args.port, reuse_port))
+    finally:
+        searcher.shutdown()
+    return searcher.stats()
+
+
+def worker(args: argparse.Namespace, results: SimpleQueue) -> None:
+    # the parent already built the index file, so this only maps it and
+    # every worker shares the same page cache
+    listener = start_logging(logging.DEBUG if args.verbose else logging.INFO)
+    index = load_index(compact=args.compact)
+    try:
+        results.put((os.getpid(), serve(args, index, reuse_port=True)))
+    finally:
+        listener.stop()
+
+
+def serve_workers(args: argparse.Namespace) -> list[tuple[int, dict[str, Any]]]:
+    results: SimpleQueue = SimpleQueue()
+    procs = [Process(target=worker, args=(args, results))
+             for _ in range(args.workers)]
+    for proc in procs:
+        proc.start()
+
+    def stop_workers(signum, frame):
+        for proc in procs:
+            if proc.is_alive() and proc.pid is not None:
+                os.kill(proc.pid, signal.SIGTERM)
+
+    signal.signal(signal.SIGINT, stop_workers)
+    signal.signal(signal.SIGTERM, stop_workers)
+    for proc in procs:
+        proc.join()
+
+    worker_stats = []
+    while not results.empty():
+        worker_stats.append(results.get())
+    return worker_stats
+
+
+def report(worker_stats: list[tuple[int, dict[str, Any]]]) -> None:
+    connections = queries = bytes_sent = hits = misses = 0
+    for pid, stats in worker_stats:
+        if len(worker_stats) > 1:
+            print(f'{pid:>8}: {stats}')
+        connections += stats['connections']
+        queries += stats['queries']
+        bytes_sent += stats['bytes_sent']
+        hits += stats['cache']['hits']
+        misses += stats['cache']['misses']
+    print(f'{len(worker_stats)} worker(s): {connections} connections, '
+          f'{queries} queries, {bytes_sent} bytes sent, '
+          f'{hits} cache hits, {misses} cache misses')
+
+
+def process_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description='Search Unicode characters by name over TCP.')
+    parser.add_argument('host', nargs='?', default='127.0.0.1')
+    parser.add_argument('port', nargs='?', type=int, default=2323)
+    parser.add_argument(
+        '-m', '--mode', choices=MODES, default='thread',
+        help='where to run expensive searches (default=thread)')
+    parser.add_argument(
+        '-c', '--offload-cost', metavar='N', type=int, default=OFFLOAD_COST,
+        help=f'offload searches scanning N+ postings (default={OFFLOAD_COST})')
+    parser.add_argument(
+        '-t', '--timeout', metavar='SECONDS', type=float, default=SEARCH_TIMEOUT,
+        help=f'per-query time limit (default={SEARCH_TIMEOUT})')
+    parser.add_argument(
+        '-p', '--pool-size', metavar='N', type=int,
+        help='threads or processes for offloaded searches')
+    parser.add_argument(
+        '-w', '--workers', metavar='N', type=int, default=1,
+        help='server processes sharing the port via SO_REUSEPORT (default=1)')
+    parser.add_argument(
+        '-k', '--compact', action='store_true',
+        help='keep index terms packed: less memory, slower fuzzy search')
+    parser.add_argument(
+        '-v', '--verbose', action='store_true',
+        help='log every connection and a sample of queries')
+    args = parser.parse_args()
+    if args.workers < 1:
+        parser.error('--workers N must be >= 1')
+    return args
+
+
+def main():
+    args = process_args()
+    print('Load index...')
+    index = load_index(compact=args.compact)
+    if args.workers == 1:
+        listener = start_logging(logging.DEBUG if args.verbose else logging.INFO)
+        try:
+            worker_stats = [(os.getpid(), serve(args, index))]
+        finally:
+            listener.stop()
+    else:
+        worker_stats = serve_workers(args)
+    print('\nServer shut down.')
+    report(worker_stats)
 
 
 if __name__ == '__main__':
-    main(*sys.argv[1:])
+    main()
@@ -0,0 +1,71 @@
+import pytest
+
+from charindex import HEADER, InvertedIndex, load_index
+
+
+@pytest.fixture(scope='module')
+def latin():
+    """Index of the Latin-1 and Latin Extended-A characters."""
+    return InvertedIndex(32, 0x180)
+
+
+def test_save_and_load(tmp_path, latin):
+    path = tmp_path / 'latin.idx'
+    latin.save(path)
+    for compact in (False, True):
+        loaded = InvertedIndex.load(path, compact)
+        assert list(loaded.terms) == list(latin.terms)
+        assert loaded.search('small a') == latin.search('small a')
+        assert loaded.json_page('sign', 0, 3) == latin.json_page('sign', 0, 3)
+
+
+@pytest.mark.parametrize('size', [0, 3, HEADER.size, 0.5, -1])
+def test_load_rejects_truncated_files(tmp_path, latin, size):
+    path = tmp_path / 'latin.idx'
+    latin.save(path)
+    data = path.read_bytes()
+    if isinstance(size, float):
+        size = int(len(data) * size)
+    path.write_bytes(data[:size])
+    with pytest.raises(ValueError):
+        InvertedIndex.load(path)
+
+
+def test_load_rejects_trailing_bytes(tmp_path, latin):
+    path = tmp_path / 'latin.idx'
+    latin.save(path)
+    with open(path, 'ab') as fp:
+        fp.write(b'\n')
+    with pytest.raises(ValueError):
+        InvertedIndex.load(path)
+
+
+def test_load_index_rebuilds_truncated_file(tmp_path, latin):
+    path = tmp_path / 'charindex.idx'
+    latin.save(path)
+    path.write_bytes(path.read_bytes()[:HEADER.size + 100])
+    index = load_index(path)
+    assert {'CAT', 'SIGN'} <= set(index.terms)
+    assert InvertedIndex.load(path).search('cat face') == index.search('cat face')
+
+
+def levenshtein(a, b):
+    row = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        prev, row[0] = row[0], i
+        for j, cb in enumerate(b, 1):
+            prev, row[j] = row[j], min(row[j] + 1, row[j - 1] + 1, prev + (ca != cb))
+    return row[-1]
+
+
+@pytest.mark.parametrize('max_distance', [1, 2])
+@pytest.mark.parametrize('word', ['CAT', 'SMAL', 'LETTRE', 'ACUTE', 'X', 'QQQQ'])
+def test_fuzzy_terms_match_levenshtein_scan(latin, word, max_distance):
+    expected = [pos for pos, term in enumerate(latin.terms)
+                if levenshtein(word, term) <= max_distance]
+    assert sorted(latin.fuzzy_terms(word, max_distance)) == expected
+
+
+def test_fuzzy_search(latin):
+    assert latin.search('smal~ leter~ a') == latin.search('small letter a')
+    assert latin.search('captal', max_distance=2) == latin.search('capital')
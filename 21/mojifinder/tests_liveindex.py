@@ -0,0 +1,112 @@
+import json
+import random
+import unicodedata
+
+import pytest
+
+from charindex import InvertedIndex, tokenize
+from liveindex import LiveIndex
+
+START, STOP = 32, 0x180
+QUERIES = ['small', 'capital letter', 'sign', 'latin small letter a',
+           'party', 'piñata', 'cat', 'cat face', 'custom symbol']
+
+
+@pytest.fixture(params=[False, True], ids=['terms', 'compact'])
+def base(request):
+    return InvertedIndex(START, STOP, compact=request.param)
+
+
+def brute_force(names, query):
+    """Characters having every word of ``query`` in one of their names."""
+    words = set(tokenize(query))
+    return {chr(code) for code, char_names in names.items()
+            if words <= {w for name in char_names for w in tokenize(name)}}
+
+
+def check(live, names):
+    for query in QUERIES:
+        assert live.search(query) == brute_force(names, query), query
+
+
+def test_add_remove_and_merge_match_brute_force(base, tmp_path):
+    rnd = random.Random(19)
+    live = LiveIndex(base, merge_threshold=7)
+    names = {code: [unicodedata.name(chr(code))] for code in range(START, STOP)
+             if unicodedata.name(chr(code), '')}
+    new_names = ['cat face', 'custom symbol', 'small party sign', 'piñata']
+    for _ in range(60):
+        code = rnd.choice([rnd.randrange(START, STOP), rnd.randrange(0xE000, 0xE010)])
+        if rnd.random() < 0.4:
+            if code in names:
+                live.remove(chr(code))
+                del names[code]
+            else:
+                with pytest.raises(KeyError):
+                    live.remove(chr(code))
+        else:
+            name = rnd.choice(new_names)
+            live.add(chr(code), name)
+            names.setdefault(code, []).append(name)
+        check(live, names)
+    assert live.merges > 0 and live.merge_failures == 0
+
+    live.merge()
+    assert live.pending() == 0
+    check(live, names)
+    path = tmp_path / 'live.idx'
+    live.save(path)
+    for compact in (False, True):
+        loaded = InvertedIndex.load(path, compact)
+        for query in QUERIES:
+            assert loaded.search(query) == brute_force(names, query), query
+
+
+def test_removed_then_readded_uses_new_name(base):
+    live = LiveIndex(base)
+    live.remove('A')
+    assert 'A' not in live.search('capital a')
+    live.add('A', 'alpha')
+    assert live.search('alpha') == {'A'}
+    assert 'A' not in live.search('capital a')
+    for merge in (False, True):
+        if merge:
+            live.merge()
+        total, payload = live.json_page('alpha')
+        assert total == 1
+        assert json.loads(payload) == [{'char': 'A', 'name': 'alpha'}]
+
+
+def test_non_ascii_names_survive_merge_and_save(base, tmp_path):
+    live = LiveIndex(base, merge_threshold=2)
+    live.add('', 'piñata party')
+    live.add('', 'crème brûlée')
+    assert live.merges == 1 and live.merge_failures == 0
+    assert live.search('piñata') == {''}
+    assert live.search('brûlée') == {''}
+    assert live.search('pinata~') == {''}
+    path = tmp_path / 'live.idx'
+    live.save(path)
+    loaded = InvertedIndex.load(path, base.compact)
+    assert loaded.search('crème') == {''}
+    assert 'PIÑATA' in loaded.terms
+
+
+def test_failed_merge_does_not_fail_updates(base, monkeypatch):
+    live = LiveIndex(base, merge_threshold=2)
+
+    def broken(*args):
+        raise RuntimeError('merge failed')
+
+    monkeypatch.setattr(InvertedIndex, 'merged', broken)
+    live.add('', 'first')
+    live.add('', 'second')
+    assert live.merge_failures == 1
+    assert live.search('second') == {''}
+    live.add('', 'third')
+    assert live.merge_failures == 1  # no retry until 2 more changes
+    monkeypatch.undo()
+    live.add('', 'fourth')
+    assert live.merges == 1 and live.pending() == 0
+    assert live.search('third') == {''}
+    assert live.memory_report()['merge_failures'] == 1
@@ -1,13 +1,19 @@
+import asyncio
+import hashlib
 from pathlib import Path
-from unicodedata import name
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Header, HTTPException, Query, Response
 from fastapi.responses import HTMLResponse
 from pydantic import BaseModel
 
-from charindex import InvertedIndex
+from charindex import load_index
+from liveindex import LiveIndex
+from responsecache import ResponseCache, query_key
 
 STATIC_PATH = Path(__file__).parent.absolute() / 'static'
+PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+CACHE_MAX_AGE = 300
 
 app = FastAPI(
     title='Mojifinder Web',
@@ -16,7 +22,8 @@ app = FastAPI(
 
 
 def init(app):
-    app.state.index = InvertedIndex()
+    app.state.index = LiveIndex(load_index())
+    app.state.cache = ResponseCache()
     app.state.form = (STATIC_PATH / 'form.html').read_text()
 
 
@@ -29,9 +36,54 @@ class CharName(BaseModel):
 
 
 @app.get('/search', response_model=list[CharName])
-async def search(q: str):
-    chars = sorted(app.state.index.search(q))
-    return ({'char': c, 'name': name(c)} for c in chars)
+async def search(q: str,
+                 offset: int = Query(0, ge=0),
+                 limit: int = Query(PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                 if_none_match: str | None = Header(None)):
+    # the payload is joined from JSON fragments stored in the index,
+    # so the CharName model only documents the schema
+    key = query_key(q, offset, limit)
+    if (cached := app.state.cache.get(key)) is None:
+        total, payload = app.state.index.json_page(q, offset, limit)
+        etag = '"' + hashlib.blake2b(payload, digest_size=8).hexdigest() + '"'
+        cached = total, payload, etag
+        app.state.cache.put(key, cached)
+    total, payload, etag = cached
+    headers = {
+        'X-Total-Count': str(total),
+        'ETag': etag,
+        'Cache-Control': f'public, max-age={CACHE_MAX_AGE}',
+    }
+    if if_none_match == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(payload, media_type='application/json', headers=headers)
+
+
+@app.post('/chars', status_code=201)
+async def add_char(char_name: CharName):
+    # a merge may run inside add, so keep it off the event loop
+    try:
+        await asyncio.to_thread(app.state.index.add, char_name.char, char_name.name)
+    except ValueError as exc:
+        raise HTTPException(status_code=422, detail=str(exc))
+    app.state.cache.clear()
+    return char_name
+
+
+@app.delete('/chars/{char}', status_code=204)
+async def remove_char(char: str):
+    try:
+        await asyncio.to_thread(app.state.index.remove, char)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f'{char!r} is not indexed')
+    app.state.cache.clear()
+    return Response(status_code=204)
+
+
+@app.get('/stats', include_in_schema=False)
+def stats():
+    return {'cache': app.state.cache.stats(),
+            'index': app.state.index.memory_report()}
 
 
 @app.get('/', response_class=HTMLResponse, include_in_schema=False)